@@ -1,29 +1,62 @@
 # analysis (e.g. doubling times, forecasting, most at risk groups)
-from functools import partial
+from functools import lru_cache, partial
 
 import numpy as np
-import pandas as pd
 import scipy.stats as st
 from bokeh.colors import RGB
 from bokeh.layouts import column, row
 from bokeh.models import (Band, Button, ColumnDataSource, DataTable, HoverTool,
                           NumberFormatter,
                           Legend, LegendItem, Line, MultiSelect, Panel,
-                          TableColumn, Tabs)
+                          TableColumn)
 from bokeh.palettes import Viridis256, viridis
 from bokeh.plotting import figure
 
+from column_store import ColumnStore
+from downsampling import Downsampler
+from lazy_tabs import create_lazy_tabs
 from sources import (get_countries_logistic_fitting_params,
-                     get_country_cases_vs_time, get_line_list_analysis,
-                     get_symptom_rates, get_US_cases_vs_time,
-                     get_US_logistic_fitting_params)
-from utils import START_DATE, START_DATE_STRING, hex_string_to_rgb
+                     get_country_cases_vs_time_columns,
+                     get_country_first_case_offsets, get_line_list_analysis,
+                     get_symptom_rates, get_US_cases_vs_time_columns,
+                     get_US_first_case_offsets, get_US_logistic_fitting_params)
+from utils import START_DATE_STRING, hex_string_to_rgb
 
 
-def create_logistic_growth_subtab(params_getter, time_series_getter, starting_regions, tab_title):
+def logistic_function(x, L, x0, k):
+    return L / (1 + np.exp(-k*(x-x0)))
+
+
+@lru_cache(maxsize=None)
+def z_star(conf_level):
+    return st.norm.ppf(1 - (1 - conf_level) / 2)
+
+
+# The curves are cached process-wide, so every session re-drawing a region reuses them;
+# they are read-only since sessions share them.
+@lru_cache(maxsize=4096)
+def logistic_curve(L, x0, k, n_days):
+    "Logistic function at days 0..n_days-1 after `START_DATE_STRING`."
+    curve = logistic_function(np.arange(n_days), L, x0, k)
+    curve.setflags(write=False)
+    return curve
+
+
+@lru_cache(maxsize=4096)
+def logistic_band(L, x0, k, L_std, conf_level, n_days):
+    "(lower, upper) logistic curves with L moved by the `conf_level` confidence interval of L."
+    margin = L_std * z_star(conf_level)
+    return logistic_curve(L - margin, x0, k, n_days), logistic_curve(L + margin, x0, k, n_days)
+
+
+def create_logistic_growth_subtab(params_getter, time_series_getter, offsets_getter, starting_regions, tab_title):
     # Data Sources
     params_df, params_CDS = params_getter()
-    time_series_df, time_series_CDS = time_series_getter()
+    _, time_series_data = time_series_getter()
+    offsets = offsets_getter()
+    # only the columns of the drawn regions are sent, downsampled to the figure's width
+    column_store = ColumnStore(time_series_data)
+    time_series_CDS = column_store.source
 
     dates = np.arange(START_DATE_STRING, '2020-07-01', dtype='datetime64[D]')
 
@@ -45,23 +78,11 @@ def create_logistic_growth_subtab(params_getter, time_series_getter, starting_re
     )
     plot.yaxis.formatter.use_scientific = False
 
+    downsampler = Downsampler(column_store, plot.x_range, plot.plot_width, starting_regions)
+
     lines = {}  # region, line pairs housing which have been drawn already
     bands = {}  # region, band pairs housing which have been drawn already
 
-    def logistic_function(x, L, x0, k):
-        return L / (1 + np.exp(-k*(x-x0)))
-
-    def z_star(conf_level):
-        return st.norm.ppf(1 - (1 - conf_level) / 2)
-
-    def get_offset_from_start_date(region):
-        subdf = time_series_df[region]
-        nonzero_subdf = subdf[subdf>0]
-
-        offset = (nonzero_subdf.index[0] - pd.to_datetime(START_DATE)).days
-
-        return offset
-
     def draw_prediction_line(region, **kwargs):
         plot_params = {
             'line_width': 4,
@@ -72,10 +93,7 @@ def create_logistic_growth_subtab(params_getter, time_series_getter, starting_re
         plot_params.update(kwargs)
 
         L, x0, k, L_std, x0_std, k_std = params_CDS.data[region]
-        xs = np.arange(lines_CDS.data['date'].size)
-        offset = get_offset_from_start_date(region)
-        line = logistic_function(xs, L, x0 + offset, k)
-        lines_CDS.data[region] = line
+        lines_CDS.data[region] = logistic_curve(L, x0 + offsets[region], k, lines_CDS.data['date'].size)
         lines[f'{region}_prediction'] = plot.line(
             x='date', y=region, source=lines_CDS,
             name=region,
@@ -91,11 +109,8 @@ def create_logistic_growth_subtab(params_getter, time_series_getter, starting_re
         plot_params.update(kwargs)
 
         L, x0, k, L_std, x0_std, k_std = params_CDS.data[region]
-        xs = np.arange(lines_CDS.data['date'].size)
-        offset = get_offset_from_start_date(region)
-        bands_CDS.data[f'{region}_lower'], bands_CDS.data[f'{region}_upper'] = (
-            logistic_function(xs, L - L_std * z_star(conf_level), x0 + offset, k), 
-            logistic_function(xs, L + L_std * z_star(conf_level), x0 + offset, k)
+        bands_CDS.data[f'{region}_lower'], bands_CDS.data[f'{region}_upper'] = logistic_band(
+            L, x0 + offsets[region], k, L_std, conf_level, bands_CDS.data['date'].size
         )
 
         bands[region] = Band(
@@ -111,6 +126,7 @@ def create_logistic_growth_subtab(params_getter, time_series_getter, starting_re
 
         plot_params.update(kwargs)
 
+        column_store.require([region])
         lines[region] = plot.line(
             x='date', y=region, source=time_series_CDS,
             name=region,
@@ -191,6 +207,8 @@ def create_logistic_growth_subtab(params_getter, time_series_getter, starting_re
             lines[f'{key}_prediction'].visible = False
             bands[key].visible = False
 
+        downsampler.set_columns(new)
+
         for key in new_lines:
             if key in lines.keys():
                 lines[key].visible = True
@@ -277,7 +295,8 @@ def create_age_gender_stats_subtab():
 create_world_logistic_growth_tab = partial(
     create_logistic_growth_subtab,
     get_countries_logistic_fitting_params,
-    get_country_cases_vs_time,
+    get_country_cases_vs_time_columns,
+    get_country_first_case_offsets,
     ['US', 'Italy', 'China'],
     'World Logistic Growth Fitting'
 )
@@ -285,7 +304,8 @@ create_world_logistic_growth_tab = partial(
 create_us_logistic_growth_tab = partial(
     create_logistic_growth_subtab,
     get_US_logistic_fitting_params,
-    get_US_cases_vs_time,
+    get_US_cases_vs_time_columns,
+    get_US_first_case_offsets,
     [
         'New York City, New York, US',
         'Westchester, New York, US',
@@ -298,11 +318,11 @@ create_us_logistic_growth_tab = partial(
 )
 
 def create_analysis_tab():
-    child = Tabs(tabs=[
-        create_world_logistic_growth_tab(),
-        create_us_logistic_growth_tab(),
-        create_symptom_stats_subtab(),
-        create_age_gender_stats_subtab(),
+    child = create_lazy_tabs([
+        ('World Logistic Growth Fitting', create_world_logistic_growth_tab),
+        ('US Logistic Growth Fitting', create_us_logistic_growth_tab),
+        ('Symptoms Experienced', create_symptom_stats_subtab),
+        ('Infection Statistics by Age & Gender', create_age_gender_stats_subtab),
     ])
 
     return Panel(child=child, title='Analysis')
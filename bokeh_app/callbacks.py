@@ -0,0 +1,26 @@
+DEFAULT_THROTTLE_INTERVAL = 150  # ms
+
+
+def on_change_throttled(model, attr, callback, interval=DEFAULT_THROTTLE_INTERVAL, use_value_throttled=False):
+    """
+    Register `callback(attr, old, new)` for changes of `model.attr`, coalescing bursts of updates.
+
+    The first change of a burst schedules `callback` `interval` milliseconds later; changes arriving
+    in the meantime only replace the pending value. `callback` then runs once with the value before
+    the burst as `old` and the latest value as `new`, so superseded updates are dropped.
+
+    With `use_value_throttled`, the client only reports `value_throttled` (e.g. slider release)
+    instead of every intermediate `attr` value.
+    """
+    pending = {}
+
+    def flush():
+        callback(attr, pending.pop('old'), pending.pop('new'))
+
+    def handler(_attr, old, new):
+        if not pending:
+            pending['old'] = old
+            model.document.add_timeout_callback(flush, interval)
+        pending['new'] = new
+
+    model.on_change('value_throttled' if use_value_throttled else attr, handler)
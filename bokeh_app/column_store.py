@@ -0,0 +1,65 @@
+import numpy as np
+from bokeh.models import ColumnDataSource
+
+DEFAULT_EVICTION_DELAY = 60000  # ms
+
+
+class ColumnStore:
+    """
+    Per-session ColumnDataSource over a shared column data dict that only holds the columns in use.
+
+    The source starts with the `always` columns plus `columns`. `require` adds columns to it, sending
+    only those; `release` evicts columns once they have gone unused for `eviction_delay` milliseconds,
+    calling `on_evict(name)` first so renderers can stop pointing at them. `set_rows` restricts every
+    column to a subset of the rows, e.g. for downsampling.
+    """
+    def __init__(self, data, columns=(), always=('index', 'date'), eviction_delay=DEFAULT_EVICTION_DELAY, on_evict=None):
+        self.data = data
+        self.eviction_delay = eviction_delay
+        self.on_evict = on_evict
+        self.rows = None
+        self.source = ColumnDataSource(data={name: self._column(name) for name in (*always, *columns)})
+        self._evictions = {}
+
+    def _column(self, name):
+        values = self.data[name]
+        return values if self.rows is None else values[self.rows]
+
+    def set_rows(self, rows):
+        """
+        Resend the columns in the source restricted to the row indices `rows` (None for all rows).
+        Nothing is sent if the rows did not change.
+        """
+        if rows is None or self.rows is None:
+            if rows is self.rows:
+                return
+        elif np.array_equal(rows, self.rows):
+            return
+
+        self.rows = rows
+        self.source.data = {name: self._column(name) for name in self.source.data}
+
+    def require(self, names):
+        "Make sure the columns `names` are in the source, cancelling their pending evictions."
+        for name in names:
+            handle = self._evictions.pop(name, None)
+            if handle is not None:
+                self.source.document.remove_timeout_callback(handle)
+
+        missing = {name: self._column(name) for name in names if name not in self.source.data}
+        if missing:
+            self.source.data.update(missing)
+
+    def release(self, names):
+        "Schedule the columns `names` for eviction from the source."
+        for name in names:
+            if name in self.source.data and name not in self._evictions:
+                self._evictions[name] = self.source.document.add_timeout_callback(
+                    lambda name=name: self._evict(name), self.eviction_delay
+                )
+
+    def _evict(self, name):
+        del self._evictions[name]
+        if self.on_evict is not None:
+            self.on_evict(name)
+        del self.source.data[name]
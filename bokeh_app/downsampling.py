@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+from callbacks import on_change_throttled
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Indices of `n_out` points of (x, y) chosen by Largest-Triangle-Three-Buckets.
+
+    The first and last points are kept; every bucket in between keeps the point forming the largest
+    triangle with the previously kept point and the average of the next bucket. NaNs count as 0.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    y = np.nan_to_num(y)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+
+    indices = np.empty(n_out, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    kept = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < edges.size else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+
+        areas = np.abs(
+            (x[kept] - next_x) * (y[start:end] - y[kept])
+            - (x[kept] - x[start:end]) * (next_y - y[kept])
+        )
+        kept = indices[i + 1] = start + np.argmax(areas)
+
+    return indices
+
+
+def min_max_indices(y, n_buckets):
+    "Sorted indices of the smallest and largest value of `y` in each of `n_buckets` equal buckets (NaNs count as smallest)."
+    n = len(y)
+    if 2 * n_buckets >= n:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, n_buckets + 1).astype(int)
+    buckets = np.repeat(np.arange(n_buckets), np.diff(edges))
+    order = np.lexsort((np.where(np.isnan(y), -np.inf, y), buckets))
+
+    return np.union1d(order[edges[:-1]], order[edges[1:] - 1])
+
+
+class Downsampler:
+    """
+    Keeps the rows of a `ColumnStore` down to about `width` points per shown column in the visible x range.
+
+    The rows are the union of the points `method` ('lttb' or 'min_max') picks from each of `columns`
+    over the visible range grown by `margin` times its size on both sides. They are picked again when
+    the view leaves that extent or narrows to less than half the width it had, so zooming in brings
+    back full resolution. `log_y` downsamples log(y), for figures with a logarithmic y axis.
+    """
+    def __init__(self, column_store, x_range, width, columns=(), x_column='date', method='lttb', log_y=False, margin=0.5):
+        self.column_store = column_store
+        self.x_range = x_range
+        self.width = width
+        self.columns = list(columns)
+        self.method = method
+        self.log_y = log_y
+        self.margin = margin
+
+        # milliseconds since epoch, the units of a datetime range
+        self.x = pd.to_datetime(column_store.data[x_column]).values.astype('datetime64[ms]').astype(float)
+        self.extent = None
+        self.visible_width = None
+
+        for attr in ('start', 'end'):
+            on_change_throttled(x_range, attr, self._range_callback)
+
+        self.update(force=True)
+
+    def _range_callback(self, attr, old, new):
+        self.update()
+
+    def set_columns(self, columns):
+        "Downsample for the shown `columns` from now on."
+        self.columns = list(columns)
+        self.update(force=True)
+
+    def update(self, force=False):
+        start, end = self.x_range.start, self.x_range.end
+        if start is None or end is None:
+            start, end = self.x[0], self.x[-1]
+
+        if not force and self.extent is not None:
+            extent_start, extent_end = self.extent
+            if extent_start <= start and end <= extent_end and end - start >= self.visible_width / 2:
+                return
+
+        margin = (end - start) * self.margin
+        self.extent = (start - margin, end + margin)
+        self.visible_width = end - start
+
+        rows = self.rows(*self.extent)
+        # columns are only resent when the picked rows change; all rows is no restriction at all
+        self.column_store.set_rows(None if rows.size == self.x.size else rows)
+
+    def rows(self, start, end):
+        "Union of the row indices picked from every shown column between x values `start` and `end`."
+        # one point beyond each end, so lines run to the edges of the extent
+        first = max(np.searchsorted(self.x, start, 'left') - 1, 0)
+        last = min(np.searchsorted(self.x, end, 'right') + 1, self.x.size)
+        n_out = int(self.width * (1 + 2 * self.margin))
+
+        rows = [np.array([first, last - 1])]
+        for name in self.columns:
+            y = np.asarray(self.column_store.data[name][first:last], dtype=float)
+            if self.log_y:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    y = np.log(np.where(y > 0, y, np.nan))
+            if self.method == 'lttb':
+                rows.append(first + lttb_indices(self.x[first:last], y, n_out))
+            else:
+                rows.append(first + min_max_indices(y, n_out // 2))
+
+        return np.unique(np.concatenate(rows))
@@ -0,0 +1,33 @@
+from bokeh.models import Div, Panel, Tabs
+
+
+def create_lazy_tabs(tab_factories, active=0, **kwargs):
+    """
+    Create `Tabs` whose panels are only built the first time they are activated.
+
+    `tab_factories` is a list of (title, factory) pairs where `factory()` returns a `Panel`.
+    Every tab starts as a lightweight placeholder; the active tab is built right away and the
+    rest are built and swapped in when `Tabs.active` first points at them.
+    """
+    factories = dict(enumerate(factory for _, factory in tab_factories))
+
+    def build_tab(index):
+        factory = factories.pop(index, None)
+        if factory is not None:
+            tabs.tabs = [*tabs.tabs[:index], factory(), *tabs.tabs[index + 1:]]
+
+    def active_callback(attr, old, new):
+        build_tab(new)
+
+    tabs = Tabs(
+        tabs=[
+            Panel(child=Div(text='Loading...'), title=title)
+            for title, _ in tab_factories
+        ],
+        active=active,
+        **kwargs
+    )
+    tabs.on_change('active', active_callback)
+    build_tab(active)
+
+    return tabs
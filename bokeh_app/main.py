@@ -1,23 +1,23 @@
 import datetime
 
-from bokeh.models import Tabs
 from bokeh.plotting import curdoc
 
+from lazy_tabs import create_lazy_tabs
 from world_map_tab import create_world_map_tab
-# from us_map_tab import create_us_map_tab
+from us_map_tab import create_us_map_tab
 from world_cases_time_series_tab import create_world_cases_time_series_tab
 from us_cases_time_series_tab import create_us_cases_time_series_tab
 from case_details_tab import create_case_details_tab
 from analysis_tab import create_analysis_tab
 
-tabs = Tabs(
-    tabs=[
-        create_world_map_tab(),
-        # create_us_map_tab(),
-        create_world_cases_time_series_tab(),
-        create_us_cases_time_series_tab(),
-        create_case_details_tab(),
-        create_analysis_tab()
+tabs = create_lazy_tabs(
+    [
+        ('World Map', create_world_map_tab),
+        ('United States Map', create_us_map_tab),
+        ('World Cases Time Series', create_world_cases_time_series_tab),
+        ('United States Cases Time Series', create_us_cases_time_series_tab),
+        ('Case Details', create_case_details_tab),
+        ('Analysis', create_analysis_tab)
     ],
     tabs_location='above'
 )
@@ -0,0 +1,73 @@
+import numpy as np
+from bokeh.models import ColumnDataSource
+
+from callbacks import on_change_throttled
+from sources import patch_changed_rows
+from spatial import select_level
+
+
+class MapView:
+    """
+    Keeps the ColumnDataSource of a map in sync with the selected date, the zoom level and the visible extent.
+
+    `levels` is a list of (max_points, MapLevel) pairs as taken by `spatial.select_level`. Only the
+    locations inside the visible extent, grown by `margin` times its size on every side, are sent;
+    panning within that fetched extent sends nothing, while zooming in to less than half the width it
+    was fetched for culls the locations again. Date changes are sent as patches.
+    """
+    def __init__(self, levels, row, x_range, y_range, margin=0.5):
+        self.levels = levels
+        self.row = row
+        self.x_range = x_range
+        self.y_range = y_range
+        self.margin = margin
+
+        self.level = None
+        self.indices = None
+        self.extent = None
+        self.visible_width = None
+        self.source = ColumnDataSource()
+        self.update_extent()
+
+        for model in (x_range, y_range):
+            for attr in ('start', 'end'):
+                on_change_throttled(model, attr, self._range_callback)
+
+    def _range_callback(self, attr, old, new):
+        self.update_extent()
+
+    def set_row(self, row):
+        "Show date row `row` of the current level's `DateMatrices`."
+        self.row = row
+        patch_changed_rows(self.source, self.level.date_columns(row, self.indices))
+
+    def update_extent(self):
+        "Re-select the level and the locations to send after the visible ranges changed."
+        x_start, x_end = self.x_range.start, self.x_range.end
+        y_start, y_end = self.y_range.start, self.y_range.end
+
+        if (
+            self.extent is not None and self._contains(x_start, x_end, y_start, y_end)
+            and x_end - x_start >= self.visible_width / 2
+        ):
+            return
+
+        x_margin = (x_end - x_start) * self.margin
+        y_margin = (y_end - y_start) * self.margin
+        self.extent = (x_start - x_margin, x_end + x_margin, y_start - y_margin, y_end + y_margin)
+        self.visible_width = x_end - x_start
+        level, indices = select_level(self.levels, self.extent)
+
+        if level is self.level and np.array_equal(indices, self.indices):
+            return
+
+        self.level, self.indices = level, indices
+        self.source.selected.indices = []
+        self.source.data = level.data(self.row, indices)
+
+    def _contains(self, x_start, x_end, y_start, y_end):
+        fetched_x_start, fetched_x_end, fetched_y_start, fetched_y_end = self.extent
+        return (
+            fetched_x_start <= x_start and x_end <= fetched_x_end
+            and fetched_y_start <= y_start and y_end <= fetched_y_end
+        )
@@ -0,0 +1,33 @@
+from bokeh.models import ColumnDataSource
+from bokeh.palettes import gray
+
+DOUBLING_PERIODS = (4, 7, 14)
+
+
+def add_doubling_lines(line_figure, dates, periods=DOUBLING_PERIODS):
+    """
+    Draw guides of cases doubling every `period` days, starting from 1 on the first of `dates`.
+
+    A doubling curve is straight on the figure's logarithmic y axis, so each guide gets its own two
+    point source (first and last date) instead of full length columns in the data source.
+    Returns the renderers.
+    """
+    x = [dates[0], dates[-1]]
+    colors = gray(len(periods) + 3)[2:-1]
+
+    renderers = []
+    for period, color in zip(periods, colors):
+        name = f'doubling_{period}_days'
+        renderers.append(line_figure.line(
+            x='date',
+            y=name,
+            source=ColumnDataSource(data={'date': x, name: [1, 2 ** ((len(dates) - 1) / period)]}),
+            legend_label=f'{period}-day Doubling Time',
+            line_color=color,
+            name=name,
+            alpha=0.6,
+            muted_alpha=0.2,
+            line_width=3
+        ))
+
+    return renderers
@@ -3,11 +3,13 @@ import numpy as np
 import matplotlib.pyplot as plt
 import os
 import scipy.stats as st
-from utils import join_to_data_folder
+from utils import join_to_data_folder, write_cleaned_data
 
 
 def main():
     line_list_df = pd.read_csv(join_to_data_folder('cleaned/COVID19_line_list_data.csv'))
+    # earlier runs wrote the index too; it is rewritten without it below
+    line_list_df.drop([col for col in line_list_df.columns if col.startswith('Unnamed:')], axis=1, inplace=True)
     datetime_columns = [
         'symptom_onset',
         'exposure_start',
@@ -25,7 +27,7 @@ def main():
     symptom_rates = (line_list_df[[col for col in line_list_df.columns if col.startswith('experienced')]].sum() / num_cases_that_reported_symptoms).sort_values(ascending=False)
     symptom_rates = symptom_rates.rename('rate').rename_axis('symptom')
 
-    symptom_rates.to_csv(join_to_data_folder('cleaned/symptom_rates.csv'))
+    write_cleaned_data(symptom_rates, 'symptom_rates.csv')
 
     line_list_df['age_group'] = pd.cut(
         x=line_list_df.age,
@@ -44,13 +46,13 @@ def main():
 
     line_list_analysis = pd.concat((age_gender_counts, age_gender_proportions, age_gender_death_counts, age_gender_death_rates), axis=1)
 
-    line_list_analysis.to_csv(join_to_data_folder('cleaned/line_list_analysis.csv'))
+    write_cleaned_data(line_list_analysis, 'line_list_analysis.csv')
 
     symptom_onset_time = (line_list_df['symptom_onset'] - line_list_df['exposure_start']).dt.days
 
     line_list_df['symptom_onset_delay'] = symptom_onset_time[pd.notna(symptom_onset_time)].reset_index(drop=True)
 
-    line_list_df.to_csv(join_to_data_folder('cleaned/COVID19_line_list_data.csv'))
+    write_cleaned_data(line_list_df, 'COVID19_line_list_data.csv', index=False, dates_as_strings=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,58 @@
+import sys
+
+import numpy as np
+import pandas as pd
+from logistic_fitting import PARAMETERS, fit_logistic_parameters
+from utils import join_to_data_folder
+
+# relative tolerances of the batch fit against curve_fit; curve_fit's standard errors come from a
+# finite difference Jacobian, so they only agree to a few digits
+PARAMETER_RTOL = 1e-4
+STD_RTOL = 1e-2
+
+
+def compare_fit_methods(cases_df, workers=None):
+    """
+    Fit `cases_df` with `method='batch'` and `method='curve_fit'` and list the disagreements.
+
+    Returns a list of (region, description) pairs: regions kept by only one of the methods, and
+    parameters or standard errors differing by more than `PARAMETER_RTOL` / `STD_RTOL`.
+    """
+    batch = fit_logistic_parameters(cases_df, workers=workers, method='batch')
+    reference = fit_logistic_parameters(cases_df, workers=workers, method='curve_fit')
+
+    problems = [
+        (region, f'only fitted by {method}')
+        for method, fitted, other in (('batch', batch, reference), ('curve_fit', reference, batch))
+        for region in fitted.columns.difference(other.columns)
+    ]
+
+    common = batch.columns.intersection(reference.columns)
+    for parameter in PARAMETERS:
+        rtol = STD_RTOL if parameter.endswith('_std') else PARAMETER_RTOL
+        values, expected = batch.loc[parameter, common], reference.loc[parameter, common]
+        mismatched = ~np.isclose(values, expected, rtol=rtol, atol=0)
+        problems.extend(
+            (region, f'{parameter} {values[region]:.6g} vs {expected[region]:.6g}')
+            for region in common[mismatched]
+        )
+
+    return problems
+
+
+def main(workers=None):
+    failed = False
+    for filename in ('country_cases_vs_time.csv', 'US_cases_vs_time.csv'):
+        cases_df = pd.read_csv(join_to_data_folder('cleaned', filename), index_col='date')
+
+        problems = compare_fit_methods(cases_df, workers)
+        print(f'{filename}: {len(problems)} disagreements between the batch and curve_fit fits')
+        for region, description in problems:
+            print(f'\t{region}: {description}')
+        failed |= bool(problems)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
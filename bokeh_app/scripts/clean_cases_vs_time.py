@@ -1,5 +1,5 @@
 import pandas as pd
-from utils import join_to_data_folder
+from utils import DATE_COLUMN_PATTERN, join_to_data_folder, roll_up, write_cleaned_data, write_shared_matrix
 
 
 def main():
@@ -8,20 +8,28 @@ def main():
 
     # change to standardize -> city, county, region, country; full_name
     new_world_df = world_df.drop([
-        'region', 'country', 'latitude', 'longitude', 'web_mercator_x', 'web_mercator_y'
-    ], axis=1).set_index('full_name').T
+        'region', 'country', 'latitude', 'longitude', 'web_mercator_x', 'web_mercator_y', 'location_id'
+    ], axis=1, errors='ignore').set_index('full_name').T
 
     new_world_df.index = pd.to_datetime(new_world_df.index, yearfirst=True).rename('date')
 
-    new_world_df.to_csv(join_to_data_folder('cleaned', 'country_cases_vs_time.csv'))
+    write_cleaned_data(new_world_df, 'country_cases_vs_time.csv', float32=True)
+    write_shared_matrix(new_world_df, 'country_cases_vs_time.csv', 'table')
+
+    # state totals, for the states fully split into counties
+    date_columns = [column for column in US_df.columns if DATE_COLUMN_PATTERN.fullmatch(column)]
+    states = roll_up(US_df, 'region', date_columns, complete='county')
+    states['full_name'] = states.region + ', US'
+    US_df = pd.concat([US_df, states], ignore_index=True)
 
     new_US_df = US_df.drop([
-        'latitude', 'longitude', 'county', 'region', 'web_mercator_x', 'web_mercator_y', 'population'
-    ], axis=1).set_index('full_name').T
+        'latitude', 'longitude', 'county', 'region', 'web_mercator_x', 'web_mercator_y', 'population', 'location_id'
+    ], axis=1, errors='ignore').set_index('full_name').T
 
     new_US_df.index = pd.to_datetime(new_US_df.index, yearfirst=True).rename('date')
 
-    new_US_df.to_csv(join_to_data_folder('cleaned', 'US_cases_vs_time.csv'))
+    write_cleaned_data(new_US_df, 'US_cases_vs_time.csv', float32=True)
+    write_shared_matrix(new_US_df, 'US_cases_vs_time.csv', 'table')
 
 
 if __name__ == "__main__":
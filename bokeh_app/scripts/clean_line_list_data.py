@@ -1,10 +1,53 @@
+import difflib
 import json
 import pickle
 import pandas as pd
 import os
-from utils import join_to_data_folder
+from utils import join_to_data_folder, write_cleaned_data
 
-def main():
+# minimum `difflib` similarity for an unknown symptom to be mapped like the closest known one
+ALIAS_MATCH_THRESHOLD = 0.85
+
+
+def encode_symptoms(symptoms, symptom_map, possible_symptoms):
+    """
+    Indicator columns `experienced_<symptom>` for every symptom in `possible_symptoms`.
+
+    `symptoms` holds ', ' separated reported symptoms per case; each is mapped to a possible symptom
+    through `symptom_map` (tokens without a mapping count as none). All columns are built at once
+    from a single tokenization. Cases without reported symptoms get `pd.NA` in every column.
+    """
+    possible_symptoms = list(dict.fromkeys(possible_symptoms))
+
+    tokens = symptoms.str.split(', ').explode()
+    mapped = tokens.map(symptom_map).astype(pd.CategoricalDtype(possible_symptoms))
+    indicators = pd.get_dummies(mapped).groupby(level=0).max()
+
+    indicators = indicators.astype(bool).astype('boolean')
+    indicators.loc[symptoms.isna()] = pd.NA
+    indicators.columns = [f"experienced_{symptom.replace(' ', '_')}" for symptom in possible_symptoms]
+
+    return indicators
+
+
+def resolve_aliases(unknown_symptoms, symptom_map, threshold=ALIAS_MATCH_THRESHOLD):
+    """
+    Map unknown symptoms to the possible symptom of their closest known alias in `symptom_map`.
+
+    Returns a dict of the symptoms whose closest alias is at least `threshold` similar
+    (see `difflib.SequenceMatcher.ratio`) and a list of the unresolved ones.
+    """
+    resolved, unresolved = {}, []
+    for symptom in unknown_symptoms:
+        matches = difflib.get_close_matches(symptom, symptom_map, n=1, cutoff=threshold)
+        if matches:
+            resolved[symptom] = symptom_map[matches[0]]
+        else:
+            unresolved.append(symptom)
+    return resolved, unresolved
+
+
+def main(interactive=False, threshold=ALIAS_MATCH_THRESHOLD):
     HERE = os.path.dirname(__file__)
 
     filename = 'COVID19_line_list_data.csv'
@@ -36,7 +79,7 @@ def main():
     ], inplace=True, axis=1)
 
     # Process symptoms
-    unique_symptoms = set(pd.get_dummies(df.symptoms.str.split(', ').apply(pd.Series).T, prefix='', prefix_sep='').columns)
+    unique_symptoms = df.symptoms.str.split(', ').explode().dropna().unique()
 
     try:
         with open(os.path.join(HERE, 'possible_symptoms.txt'), 'r') as fh:
@@ -85,29 +128,45 @@ def main():
             'thirsty': 'thirst', 'thirst': 'thirst', 'vomiting': 'vomiting'
         }
         
-    for symptom in unique_symptoms:
-        if symptom not in symptom_map:
+    known_symptoms = len(symptom_map), len(possible_symptoms)
+
+    resolved, unresolved = resolve_aliases(
+        sorted(symptom for symptom in unique_symptoms if symptom not in symptom_map), symptom_map, threshold
+    )
+    symptom_map.update(resolved)
+
+    if interactive:
+        for symptom in unresolved:
             print('\n\t- '.join(['Options:', *possible_symptoms]))
             print(f'"{symptom}" does not have a known alias.')
             alias = input(f'Enter alias for "{symptom}": ')
             if alias not in possible_symptoms:
                 possible_symptoms.append(alias)
-            symptom_map[alias] = symptom
-            
-    with open(os.path.join(HERE, 'symptom_map.json'), 'w') as fh:
-        json.dump(symptom_map, fh, indent=4)
-        
-    with open(os.path.join(HERE, 'possible_symptoms.txt'), 'w') as fh:
-        fh.write('\n'.join(possible_symptoms))
+            symptom_map[symptom] = alias
+        unresolved = []
+
+    # unresolved symptoms count as none until they are added to symptom_map.json
+    review_file = os.path.join(HERE, 'unresolved_symptoms.txt')
+    if unresolved:
+        print(f'{len(unresolved)} symptoms without a known alias, see {review_file}')
+        with open(review_file, 'w') as fh:
+            fh.write('\n'.join(unresolved))
+    elif os.path.exists(review_file):
+        os.remove(review_file)
+
+    symptom_files = [os.path.join(HERE, 'symptom_map.json'), os.path.join(HERE, 'possible_symptoms.txt')]
+    if (len(symptom_map), len(possible_symptoms)) != known_symptoms or not all(map(os.path.exists, symptom_files)):
+        with open(os.path.join(HERE, 'symptom_map.json'), 'w') as fh:
+            json.dump(symptom_map, fh, indent=4)
+
+        with open(os.path.join(HERE, 'possible_symptoms.txt'), 'w') as fh:
+            fh.write('\n'.join(possible_symptoms))
 
-    for symptom in possible_symptoms:
-        df[f"experienced_{symptom.replace(' ', '_')}"] = df.symptoms.str.split(', ').apply(
-            lambda value: pd.NA if isinstance(value, float) else True if symptom in [symptom_map[item] for item in value] else False
-        )
+    df = pd.concat([df, encode_symptoms(df.symptoms, symptom_map, possible_symptoms)], axis=1)
 
     df['symptom_onset_delay'] = (df['symptom_onset'] - df['exposure_start']).dt.days
 
-    df.to_csv(join_to_data_folder('cleaned', filename), index=False)
+    write_cleaned_data(df, filename, index=False, dates_as_strings=True)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
 import os
+from utils import location_full_name, roll_up, write_cleaned_data
 
 
 def main():
@@ -17,13 +18,7 @@ def main():
     )
     S_df.columns = ['country', 'code', 'population_2018']
     S_df.dropna(inplace=True)
-    S_df.to_csv(
-        os.path.join(
-            DATA_FOLDER,
-            'cleaned', 'populations.csv'
-        ),
-        index=False
-    )
+    write_cleaned_data(S_df, 'populations.csv', index=False)
 
     # Recovered : recovered
     R_df = pd.read_csv(
@@ -33,19 +28,12 @@ def main():
         )
     )
     R_df.columns = ['region', 'country', 'latitude', 'longitude', *[date.strftime('%Y-%m-%d') for date in pd.to_datetime(R_df.columns[4:])]]
-    R_df['full_name'] = R_df.apply(lambda row: ', '.join(filter(pd.notna, [row.region, row.country])), axis=1)
-    china_series = R_df.loc[R_df.country=='China'].sum()
-    china_series['full_name'] = 'China'
-    R_df = R_df.append(china_series, ignore_index=True)
+    R_df = pd.concat([R_df, roll_up(R_df, 'country', R_df.columns[4:], complete='region')], ignore_index=True)
+    R_df['full_name'] = location_full_name(R_df.region, R_df.country)
     R_df.drop(['region', 'country', 'latitude', 'longitude'], axis=1, inplace=True)
     R_df = R_df.drop('full_name', axis=1).T.rename(columns=R_df['full_name'])
     R_df.index = pd.to_datetime(R_df.index, yearfirst=True).rename('date')
-    R_df.to_csv(
-        os.path.join(
-            DATA_FOLDER,
-            'cleaned', 'time_series_covid_19_recovered.csv'
-        )
-    )
+    write_cleaned_data(R_df, 'time_series_covid_19_recovered.csv', float32=True)
 
     # Deaths : deaths
     D_df = pd.read_csv(
@@ -55,19 +43,12 @@ def main():
         )
     )
     D_df.columns = ['region', 'country', 'latitude', 'longitude', *[date.strftime('%Y-%m-%d') for date in pd.to_datetime(D_df.columns[4:])]]
-    D_df['full_name'] = D_df.apply(lambda row: ', '.join(filter(pd.notna, [row.region, row.country])), axis=1)
-    china_series = D_df.loc[D_df.country=='China'].sum()
-    china_series['full_name'] = 'China'
-    D_df = D_df.append(china_series, ignore_index=True)
+    D_df = pd.concat([D_df, roll_up(D_df, 'country', D_df.columns[4:], complete='region')], ignore_index=True)
+    D_df['full_name'] = location_full_name(D_df.region, D_df.country)
     D_df.drop(['region', 'country', 'latitude', 'longitude'], axis=1, inplace=True)
     D_df = D_df.drop('full_name', axis=1).T.rename(columns=D_df['full_name'])
     D_df.index = pd.to_datetime(D_df.index, yearfirst=True).rename('date')
-    D_df.to_csv(
-        os.path.join(
-            DATA_FOLDER,
-            'cleaned', 'time_series_covid_19_deaths.csv'
-        )
-    )
+    write_cleaned_data(D_df, 'time_series_covid_19_deaths.csv', float32=True)
 
 
 if __name__ == "__main__":
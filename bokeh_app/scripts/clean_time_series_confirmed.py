@@ -1,7 +1,9 @@
 import pandas as pd
-from utils import longitude_latitude_to_web_mercator
+from utils import (
+    DATE_COLUMN_PATTERN, location_full_name, location_ids, longitude_latitude_to_web_mercator, roll_up,
+    write_cleaned_data, write_shared_matrix
+)
 import os
-import numpy as np
 
 def main():
     HERE = os.path.dirname(__file__)
@@ -23,31 +25,21 @@ def main():
         ]
     ]
 
-    def join_region_country(row):
-        return ', '.join(filter(pd.notna, [row.region, row.country]))
+    # totals of the countries that are only reported by region (China, Canada, Australia, ...)
+    date_columns = [column for column in df.columns if DATE_COLUMN_PATTERN.fullmatch(column)]
+    countries = roll_up(df, 'country', date_columns, ['latitude', 'longitude'], complete='region')
+    df = pd.concat([df, countries], ignore_index=True)
 
-    df['full_name'] = df[['region', 'country']].apply(join_region_country, axis=1)
+    df['full_name'] = location_full_name(df.region, df.country)
 
     df['web_mercator_x'], df['web_mercator_y'] = longitude_latitude_to_web_mercator(
         df['latitude'].values, df['longitude'].values
     )
 
-    china_df = df.loc[df.country=='China']
-    china_long_lat = china_df[['latitude', 'longitude']].mean()
-    china_web_mercators = longitude_latitude_to_web_mercator(
-        china_long_lat['latitude'], china_long_lat['longitude']
-    )
-    china_totals = china_df.drop([
-        'region', 'country', 'latitude', 'longitude', 'web_mercator_x', 'web_mercator_y', 'full_name'
-    ], axis=1).sum().T
-
-    china_totals['web_mercator_x'], china_totals['web_mercator_y'] = china_web_mercators
-    china_totals['latitude'], china_totals['longitude'] = china_long_lat['latitude'], china_long_lat['longitude']
-    china_totals['full_name'], china_totals['region'], china_totals['country'] = ('China', np.nan, 'China')
-
-    df = df.append(china_totals, ignore_index=True)
+    df['location_id'] = location_ids(df.full_name)
 
-    df.to_csv(os.path.join(DATA_FOLDER, 'cleaned', filename), index=False)
+    write_cleaned_data(df, filename, index=False)
+    write_shared_matrix(df, filename, 'locations')
 
 
 if __name__ == "__main__":
@@ -1,32 +1,43 @@
 import pandas as pd
-from utils import longitude_latitude_to_web_mercator
-import os
+from utils import ChunkedCleanedDataWriter, join_to_data_folder, location_ids, longitude_latitude_to_web_mercator
 
-def main():
-    HERE = os.path.dirname(__file__)
-    DATA_FOLDER = os.path.join(os.path.dirname(HERE), 'data')
+# raw rows read, projected and written at a time
+CHUNKSIZE = 500
+
+TEXT_COLUMNS = {'Admin2': str, 'Province_State': str, 'Combined_Key': str}
 
-    filename = 'time_series_covid_19_confirmed_US.csv'
-    df = pd.read_csv(os.path.join(DATA_FOLDER, 'raw', filename))
 
-    df.drop(['UID', 'iso3', 'iso2', 'code3', 'FIPS', 'Country_Region'], axis=1, inplace=True)
+def clean_chunk(df, population):
+    df = df.drop(['UID', 'iso3', 'iso2', 'code3', 'FIPS', 'Country_Region'], axis=1)
 
     df.rename(columns={'Admin2': 'county', 'Province_State': 'region', 'Lat': 'latitude', 'Long_': 'longitude', 'Combined_Key': 'full_name'}, inplace=True)
 
     df['web_mercator_x'], df['web_mercator_y'] = longitude_latitude_to_web_mercator(df.latitude.values, df.longitude.values)
 
-    US_deaths_filename = 'time_series_covid_19_deaths_US.csv'
-    df['population'] = pd.read_csv(os.path.join(DATA_FOLDER, 'raw', US_deaths_filename), usecols=['Population'])
-    df.drop(df.loc[df.population==0].index, inplace=True)
+    df['population'] = population
+    df = df.loc[df.population != 0]
 
     df.columns = [
         *df.columns[:5],
         *[date.strftime('%Y-%m-%d') for date in pd.to_datetime(df.columns[5:-3])],
         *df.columns[-3:]
     ]
+    df['location_id'] = location_ids(df.full_name)
+    return df
+
+
+def main(chunksize=CHUNKSIZE):
+    filename = 'time_series_covid_19_confirmed_US.csv'
+    US_deaths_filename = 'time_series_covid_19_deaths_US.csv'
+
+    # the deaths file lists the same counties in the same order; its population column is read alongside
+    chunks = pd.read_csv(join_to_data_folder('raw', filename), dtype=TEXT_COLUMNS, chunksize=chunksize)
+    populations = pd.read_csv(join_to_data_folder('raw', US_deaths_filename), usecols=['Population'], chunksize=chunksize)
 
-    df.to_csv(os.path.join(DATA_FOLDER, 'cleaned', filename), index=False)
+    with ChunkedCleanedDataWriter(filename, shared_matrix=True) as writer:
+        for df, population in zip(chunks, populations):
+            writer.write(clean_chunk(df, population['Population']))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,315 @@
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import curve_fit
+from scipy.special import expit
+from utils import join_to_data_folder, write_cleaned_data
+
+PARAMETERS = ['L', 'x0', 'k', 'L_std', 'x0_std', 'k_std']
+
+BOUNDS = (
+    (0, -365, 0),
+    (1e7, 365, 3)
+)
+
+# series with fewer days of positive cases are not fitted
+MIN_POINTS = 30
+
+
+def logistic_function(x, L, x0, k):
+    return L / (1 + np.exp(-k * (x - x0)))
+
+
+def get_fit_params(values, p0=None):
+    """
+    Fit the logistic function to the positive part of a cumulative case series.
+
+    Returns [L, x0, k, L_std, x0_std, k_std] with x0 counted in days from the first positive value,
+    or NaNs if the series is too short or the fit does not converge. `p0` optionally gives starting
+    values of L, x0 and k.
+    """
+    new_values = values[values > 0]
+
+    nans = np.full(len(PARAMETERS), np.nan)
+
+    if new_values.size < MIN_POINTS:
+        return nans
+
+    try:
+        popt, pcov = curve_fit(logistic_function, np.arange(new_values.size), new_values, p0=p0, bounds=BOUNDS)
+    except RuntimeError:
+        return nans
+    else:
+        stds = np.sqrt(np.diag(pcov))
+        return np.concatenate([popt, stds])
+
+
+def stack_positive_values(chunk):
+    """
+    Left-align the positive values of every column of a (dates × regions) array.
+
+    Returns a zero padded (regions × days) array of values and the matching boolean mask.
+    """
+    positive = (chunk > 0).T
+    counts = positive.sum(axis=1)
+
+    values = np.zeros((positive.shape[0], counts.max(initial=0)))
+    mask = np.zeros(values.shape, dtype=bool)
+
+    regions, dates = np.nonzero(positive)
+    days = np.cumsum(positive, axis=1)[regions, dates] - 1
+    values[regions, days] = chunk.T[regions, dates]
+    mask[regions, days] = True
+
+    return values, mask
+
+
+def initial_guess(values, mask):
+    "Data driven starting point: L at the latest value, x0 where half of it was reached, moderate k."
+    L = values.max(axis=1)
+    x0 = ((values < L[:, np.newaxis] / 2) & mask).sum(axis=1)
+    k = np.full(L.size, 0.1)
+    return np.clip(np.column_stack([L, x0, k]), *BOUNDS)
+
+
+def batch_fit_params(values, mask, p0=None, max_iterations=500, tolerance=1e-8):
+    """
+    Fit the logistic function to many series at once with a vectorized Levenberg-Marquardt solver.
+
+    Every iteration evaluates the Jacobians and the damped Gauss-Newton steps of all series together;
+    steps are projected onto `BOUNDS` and series drop out once they have converged.
+
+    Parameters
+    ----------
+    values, mask : np.ndarray
+        (series × days) zero padded values and the mask of real data points, see `stack_positive_values`.
+
+    p0 : np.ndarray
+        (series × 3) starting values of L, x0 and k. Rows containing NaN use `initial_guess`.
+
+    Returns
+    -------
+    np.ndarray
+        (series × 6) array of [L, x0, k, L_std, x0_std, k_std], NaN where the series has fewer than
+        `MIN_POINTS` values or the solver did not converge within `max_iterations`.
+    """
+    lower, upper = (np.array(bound, dtype=float) for bound in BOUNDS)
+    n_series = values.shape[0]
+    n_points = mask.sum(axis=1)
+    x = np.arange(values.shape[1], dtype=float)
+
+    params = initial_guess(values, mask)
+    if p0 is not None:
+        p0 = np.asarray(p0, dtype=float)
+        has_p0 = ~np.isnan(p0).any(axis=1)
+        params[has_p0] = np.clip(p0[has_p0], lower, upper)
+
+    def residuals_and_jacobian(params, rows):
+        L, x0, k = (params[:, [i]] for i in range(3))
+        s = expit(k * (x - x0))
+        ds = s * (1 - s)
+        residuals = (values[rows] - L * s) * mask[rows]
+        jacobian = np.stack([s, -L * k * ds, L * (x - x0) * ds], axis=-1) * mask[rows, :, np.newaxis]
+        return residuals, jacobian
+
+    residuals, jacobian = residuals_and_jacobian(params, slice(None))
+    cost = (residuals ** 2).sum(axis=1)
+    damping = np.full(n_series, 1e-3)
+
+    active = n_points >= MIN_POINTS
+    converged = np.zeros(n_series, dtype=bool)
+
+    for _ in range(max_iterations):
+        if not active.any():
+            break
+
+        idx = np.flatnonzero(active)
+        J, r = jacobian[idx], residuals[idx]
+        JTJ = np.einsum('sti,stj->sij', J, J)
+        gradient = np.einsum('sti,st->si', J, r)
+
+        diagonal = np.einsum('sii->si', JTJ)
+        A = JTJ + (damping[idx, np.newaxis] * (diagonal + 1e-12))[..., np.newaxis] * np.eye(3)
+        try:
+            step = np.linalg.solve(A, gradient[..., np.newaxis])[..., 0]
+        except np.linalg.LinAlgError:
+            step = np.einsum('sij,sj->si', np.linalg.pinv(A), gradient)
+
+        new_params = np.clip(params[idx] + step, lower, upper)
+        new_residuals, new_jacobian = residuals_and_jacobian(new_params, idx)
+        new_cost = (new_residuals ** 2).sum(axis=1)
+
+        improved = new_cost < cost[idx]
+        accepted = idx[improved]
+        params[accepted] = new_params[improved]
+        residuals[accepted], jacobian[accepted] = new_residuals[improved], new_jacobian[improved]
+
+        done = improved & (cost[idx] - new_cost <= tolerance * cost[idx])
+        done |= ~improved & np.all(np.abs(step) <= tolerance * (np.abs(params[idx]) + tolerance), axis=1)
+        cost[accepted] = new_cost[improved]
+
+        damping[idx] = np.where(improved, damping[idx] / 10, damping[idx] * 10)
+        converged[idx[done]] = True
+        active[idx[done]] = False
+
+    results = np.full((n_series, len(PARAMETERS)), np.nan)
+    ok = np.flatnonzero(converged)
+    if ok.size:
+        results[ok, :3] = params[ok]
+        results[ok, 3:] = np.sqrt(np.einsum('sii->si', covariance(jacobian[ok], cost[ok], n_points[ok])))
+
+    return results
+
+
+def covariance(jacobian, cost, n_points):
+    """
+    Parameter covariance matrices of many least squares fits, computed like `scipy.optimize.curve_fit`.
+
+    The pseudo-inverse of J^T J is taken from the SVD of the (zero padded) Jacobian `J` itself rather
+    than from J^T J, whose condition number is the square of J's; singular values below
+    `eps * max(J.shape) * s[0]` are dropped. The result is scaled by the residual variance
+    `cost / (n_points - 3)`.
+    """
+    _, s, VT = np.linalg.svd(jacobian, full_matrices=False)
+    threshold = np.finfo(float).eps * np.maximum(n_points, VT.shape[-1]) * s[:, 0]
+    inverse_squares = np.where(s > threshold[:, np.newaxis], 1 / np.where(s > 0, s, 1) ** 2, 0)
+    pcov = np.einsum('sji,sj,sjk->sik', VT, inverse_squares, VT)
+
+    residual_variance = cost / (n_points - 3)
+    return pcov * residual_variance[:, np.newaxis, np.newaxis]
+
+
+def fit_chunk(work, method='batch'):
+    """
+    Fit every column of a (dates × regions) array, optionally warm started from a (regions × 3) array
+    of L, x0 and k (rows with NaN start cold). `work` is a (chunk, p0) pair; returns a (regions × parameters) array.
+    """
+    chunk, p0 = work
+    if method == 'batch':
+        return batch_fit_params(*stack_positive_values(chunk), p0=p0)
+
+    if p0 is None:
+        p0 = np.full((chunk.shape[1], 3), np.nan)
+    return np.array([
+        get_fit_params(column, None if np.isnan(start).any() else np.clip(start, *BOUNDS))
+        for column, start in zip(chunk.T, p0)
+    ]).reshape(-1, len(PARAMETERS))
+
+
+def fit_logistic_parameters(cases_df, workers=None, chunksize=256, method='batch', p0=None):
+    """
+    Fit the logistic function to every column of a (dates × regions) DataFrame of cumulative cases.
+
+    Parameters
+    ----------
+    cases_df : pd.DataFrame
+        Cumulative cases with one column per region.
+
+    workers : int
+        Number of worker processes the chunks are distributed over. Defaults to the CPU count;
+        1 fits everything in the calling process.
+
+    chunksize : int
+        Number of regions per work unit.
+
+    method : str
+        'batch' fits each chunk at once with `batch_fit_params`; 'curve_fit' calls
+        `scipy.optimize.curve_fit` once per region.
+
+    p0 : pd.DataFrame
+        Warm starts shaped like the output (at least the L, x0 and k rows). Regions missing from it,
+        or with NaN parameters, start from the default guess.
+
+    Returns
+    -------
+    pd.DataFrame
+        Fitted parameters (rows, index named `parameters`) by region (columns), in the column order
+        of `cases_df`. Regions that could not be fitted, have an infinite standard error or whose
+        `L_std` exceeds `L` are dropped.
+    """
+    values = cases_df.values.astype(float)
+    starts = None if p0 is None else p0.reindex(index=PARAMETERS[:3], columns=cases_df.columns).values.T
+    chunks = [
+        (values[:, start:start + chunksize], None if starts is None else starts[start:start + chunksize])
+        for start in range(0, values.shape[1], chunksize)
+    ]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(chunks) <= 1:
+        results = [fit_chunk(chunk, method) for chunk in chunks]
+    else:
+        # spawn rather than fork: the pipeline runner calls this from a worker thread
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            # `map` yields results in submission order, so the output order is deterministic
+            results = list(executor.map(partial(fit_chunk, method=method), chunks))
+
+    fitted = np.concatenate(results) if results else np.empty((0, len(PARAMETERS)))
+
+    fitted_logistic_parameters = pd.DataFrame(
+        fitted.T,
+        index=pd.Index(PARAMETERS, name='parameters'),
+        columns=cases_df.columns
+    )
+
+    fitted_logistic_parameters = fitted_logistic_parameters.replace(np.inf, np.nan).dropna(axis=1)
+
+    # drop cols where L_std > L
+    L_std_too_large = fitted_logistic_parameters.loc['L_std'] > fitted_logistic_parameters.loc['L']
+
+    return fitted_logistic_parameters.loc[:, ~L_std_too_large]
+
+
+def series_fingerprints(cases_df):
+    "Hash of the positive values of every column, the part of a series a fit depends on."
+    return {
+        column: hashlib.sha1(np.ascontiguousarray(values[values > 0], dtype=float).tobytes()).hexdigest()
+        for column, values in cases_df.items()
+    }
+
+
+def refit_logistic_parameters(cases_df, filename, incremental=True, method='batch', **kwargs):
+    """
+    Fit `cases_df` with `fit_logistic_parameters` and save the result to `data/cleaned/filename`.
+
+    In incremental mode the previous parameters file is reused: regions whose series did not change since
+    the last run (according to the fingerprints saved next to it) keep their parameters, and the rest
+    are refitted warm started from their previous parameters. Extra keyword arguments are passed to
+    `fit_logistic_parameters`.
+    """
+    params_file = join_to_data_folder('cleaned', filename)
+    fingerprints_file = os.path.splitext(params_file)[0] + '_fingerprints.json'
+    fingerprints = series_fingerprints(cases_df)
+
+    previous_params = pd.DataFrame(index=pd.Index(PARAMETERS, name='parameters'))
+    previous_fingerprints = {}
+    if incremental and os.path.exists(params_file) and os.path.exists(fingerprints_file):
+        with open(fingerprints_file, 'r') as fh:
+            saved = json.load(fh)
+        if saved.get('method') == method:
+            previous_params = pd.read_csv(params_file, index_col='parameters')
+            previous_fingerprints = saved['series']
+
+    changed = [column for column in cases_df.columns if previous_fingerprints.get(column) != fingerprints[column]]
+    unchanged = [
+        column for column in cases_df.columns
+        if column not in set(changed) and column in previous_params.columns
+    ]
+
+    refitted = fit_logistic_parameters(cases_df[changed], method=method, p0=previous_params, **kwargs)
+    fitted_logistic_parameters = pd.concat([previous_params[unchanged], refitted], axis=1)
+    fitted_logistic_parameters = fitted_logistic_parameters[
+        [column for column in cases_df.columns if column in fitted_logistic_parameters.columns]
+    ]
+    fitted_logistic_parameters.index.rename('parameters', inplace=True)
+
+    write_cleaned_data(fitted_logistic_parameters, filename)
+    with open(fingerprints_file, 'w') as fh:
+        json.dump({'method': method, 'series': fingerprints}, fh)
+
+    return fitted_logistic_parameters
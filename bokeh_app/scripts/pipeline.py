@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, NamedTuple, Tuple
+
+
+class Step(NamedTuple):
+    """
+    One stage of the cleaning/analysis pipeline.
+
+    `inputs` and `outputs` are absolute file paths. A step depends on every other step producing
+    one of its inputs; it may list a file among both its inputs and outputs if it rewrites it.
+    """
+    name: str
+    func: Callable
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+
+
+def file_hash(path):
+    "SHA-256 of a file's contents, or None if it does not exist."
+    if not os.path.exists(path):
+        return None
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_dependencies(steps):
+    "Map each step name to the names of the other steps producing its inputs."
+    producers = {}
+    for step in steps:
+        for output in step.outputs:
+            producers.setdefault(output, []).append(step.name)
+
+    return {
+        step.name: {
+            producer
+            for path in step.inputs
+            for producer in producers.get(path, [])
+            if producer != step.name
+        }
+        for step in steps
+    }
+
+
+def run_pipeline(steps, state_file, workers=None, force=False):
+    """
+    Run `steps` in dependency order, in parallel where possible, skipping up to date steps.
+
+    A step is up to date when all its outputs exist and the content hashes of its inputs match those
+    recorded in `state_file` after its last successful run. Hashes are taken once the steps it depends
+    on have finished, so a dependency that rewrote a file makes its dependents run too. `force` runs
+    every step. Returns the names of the steps that ran.
+    """
+    steps_by_name = {step.name: step for step in steps}
+    dependencies = get_dependencies(steps)
+
+    try:
+        with open(state_file, 'r') as fh:
+            state = json.load(fh)
+    except FileNotFoundError:
+        state = {}
+
+    def input_hashes(step):
+        return {path: file_hash(path) for path in step.inputs}
+
+    def is_up_to_date(step):
+        return (
+            not force
+            and all(os.path.exists(path) for path in step.outputs)
+            and state.get(step.name) == input_hashes(step)
+        )
+
+    pending = set(steps_by_name)
+    finished = set()
+    ran = []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {}
+
+        while pending or running:
+            ready = [name for name in sorted(pending) if dependencies[name] <= finished]
+            for name in ready:
+                pending.discard(name)
+                if is_up_to_date(steps_by_name[name]):
+                    print(f'Skipping {name} (up to date)')
+                    finished.add(name)
+                else:
+                    print(f'Running {name}')
+                    running[executor.submit(steps_by_name[name].func)] = name
+
+            if ready and not running:
+                # skipped steps may have unblocked others
+                continue
+
+            if not running:
+                raise ValueError(f'Circular dependencies between steps: {", ".join(sorted(pending))}')
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                future.result()
+
+                # record hashes after the run, so steps rewriting their own inputs stay up to date
+                state[name] = input_hashes(steps_by_name[name])
+                with open(state_file, 'w') as fh:
+                    json.dump(state, fh, indent=4)
+
+                finished.add(name)
+                ran.append(name)
+
+    return ran
@@ -1,3 +1,7 @@
+import argparse
+import os
+from functools import partial
+
 from clean_time_series_confirmed import main as main_1
 from clean_time_series_confirmed_US import main as main_2
 from clean_line_list_data import main as main_3
@@ -6,14 +10,113 @@ from clean_population_recovered_and_deaths import main as main_5
 from analyze_countries_logistic_fitting import main as main_6
 from analyze_us_logistic_fitting import main as main_7
 from analyze_line_list_data import main as main_8
+from pipeline import Step, run_pipeline
+from utils import LOCATION_IDS_FILE, feather, join_to_data_folder
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+script = partial(os.path.join, HERE)
+raw = partial(join_to_data_folder, 'raw')
+cleaned = partial(join_to_data_folder, 'cleaned')
+
+# The two logistic fitting steps run at the same time, each with its own process pool, so they share the CPUs
+FIT_WORKERS = max((os.cpu_count() or 1) // 2, 1)
+
+
+def cleaned_outputs(*filenames, shared_matrix=False):
+    """
+    Every file written for the cleaned tables `filenames`: the CSV, its Feather copy when pyarrow is
+    installed and, with `shared_matrix`, the .npy matrix and .json sidecar in `data/cleaned/arrays/`.
+    """
+    outputs = []
+    for filename in filenames:
+        stem = os.path.splitext(filename)[0]
+        outputs.append(cleaned(filename))
+        if feather is not None:
+            outputs.append(cleaned(stem + '.feather'))
+        if shared_matrix:
+            outputs.extend([cleaned('arrays', stem + '.npy'), cleaned('arrays', stem + '.json')])
+    return tuple(outputs)
+
+
+# Outputs are every file a step writes, except scripts/unresolved_symptoms.txt, which
+# clean_line_list_data only writes while some symptoms are unresolved.
+
+STEPS = [
+    Step(
+        'clean_time_series_confirmed', main_1,
+        inputs=(script('clean_time_series_confirmed.py'), script('utils.py'), raw('time_series_covid_19_confirmed.csv')),
+        outputs=(*cleaned_outputs('time_series_covid_19_confirmed.csv', shared_matrix=True), LOCATION_IDS_FILE)
+    ),
+    Step(
+        'clean_time_series_confirmed_US', main_2,
+        inputs=(
+            script('clean_time_series_confirmed_US.py'), script('utils.py'),
+            raw('time_series_covid_19_confirmed_US.csv'), raw('time_series_covid_19_deaths_US.csv')
+        ),
+        outputs=(*cleaned_outputs('time_series_covid_19_confirmed_US.csv', shared_matrix=True), LOCATION_IDS_FILE)
+    ),
+    Step(
+        'clean_line_list_data', main_3,
+        inputs=(
+            script('clean_line_list_data.py'), script('utils.py'), raw('COVID19_line_list_data.csv'),
+            script('symptom_map.json'), script('possible_symptoms.txt')
+        ),
+        outputs=(
+            *cleaned_outputs('COVID19_line_list_data.csv'), script('symptom_map.json'), script('possible_symptoms.txt')
+        )
+    ),
+    Step(
+        'clean_cases_vs_time', main_4,
+        inputs=(
+            script('clean_cases_vs_time.py'), script('utils.py'),
+            cleaned('time_series_covid_19_confirmed.csv'), cleaned('time_series_covid_19_confirmed_US.csv')
+        ),
+        outputs=cleaned_outputs('country_cases_vs_time.csv', 'US_cases_vs_time.csv', shared_matrix=True)
+    ),
+    Step(
+        'clean_population_recovered_and_deaths', main_5,
+        inputs=(
+            script('clean_population_recovered_and_deaths.py'), script('utils.py'), raw('population_by_country.csv'),
+            raw('time_series_covid_19_recovered.csv'), raw('time_series_covid_19_deaths.csv')
+        ),
+        outputs=cleaned_outputs(
+            'populations.csv', 'time_series_covid_19_recovered.csv', 'time_series_covid_19_deaths.csv'
+        )
+    ),
+    Step(
+        'analyze_countries_logistic_fitting', partial(main_6, workers=FIT_WORKERS),
+        inputs=(
+            script('analyze_countries_logistic_fitting.py'), script('logistic_fitting.py'), script('utils.py'),
+            cleaned('country_cases_vs_time.csv')
+        ),
+        outputs=(
+            *cleaned_outputs('countries_logistic_fitting_params.csv'),
+            cleaned('countries_logistic_fitting_params_fingerprints.json')
+        )
+    ),
+    Step(
+        'analyze_us_logistic_fitting', partial(main_7, workers=FIT_WORKERS),
+        inputs=(
+            script('analyze_us_logistic_fitting.py'), script('logistic_fitting.py'), script('utils.py'),
+            cleaned('US_cases_vs_time.csv')
+        ),
+        outputs=(
+            *cleaned_outputs('US_logistic_fitting_params.csv'), cleaned('US_logistic_fitting_params_fingerprints.json')
+        )
+    ),
+    Step(
+        'analyze_line_list_data', main_8,
+        inputs=(script('analyze_line_list_data.py'), script('utils.py'), cleaned('COVID19_line_list_data.csv')),
+        outputs=cleaned_outputs('symptom_rates.csv', 'line_list_analysis.csv', 'COVID19_line_list_data.csv')
+    ),
+]
 
 
 if __name__ == "__main__":
-    main_1()
-    main_2()
-    main_3()
-    main_4()
-    main_5()
-    main_6()
-    main_7()
-    main_8()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Run the cleaning and analysis steps whose inputs changed.')
+    parser.add_argument('--force', action='store_true', help='run every step, even if it is up to date')
+    parser.add_argument('--workers', type=int, default=None, help='maximum number of steps to run at once')
+    args = parser.parse_args()
+
+    run_pipeline(STEPS, join_to_data_folder('pipeline_state.json'), workers=args.workers, force=args.force)
@@ -1,8 +1,12 @@
 from pyproj import Transformer
+import json
 import os
-from functools import partial
+import re
+import threading
+from functools import lru_cache, partial
 from typing import Callable, Tuple
 import numpy as np
+import pandas as pd
 from scipy.optimize import curve_fit
 from scipy.integrate import solve_ivp
 
@@ -16,13 +20,360 @@ DATA_FOLDER = os.path.join(
 
 join_to_data_folder = partial(os.path.join, DATA_FOLDER)
 
-def longitude_latitude_to_web_mercator(latitude, longitude):
-    transformer = Transformer.from_crs("epsg:4326", "epsg:3857")
-    web_merc_x, web_merc_y = transformer.transform(latitude, longitude)
-    
+DATE_COLUMN_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # the Feather copies are optional; the app falls back to the CSVs
+    pa = feather = None
+
+
+def write_cleaned_data(data, filename, index=True, float32=False, dates_as_strings=False):
+    """
+    Write a DataFrame or Series to `data/cleaned/filename` as CSV and, if pyarrow is installed,
+    as a Feather file with the same stem that the app loads instead of parsing the CSV.
+
+    The Feather file holds the same columns `pd.read_csv` would produce (a written unnamed index
+    becomes 'Unnamed: 0'), with typed columns and parsed datetimes. Categorical columns are stored
+    as plain values. `float32` downcasts float64 columns. `dates_as_strings` stores datetime columns
+    as the YYYY-MM-DD strings the CSV holds, for tables whose dates are shown as text.
+    """
+    file = join_to_data_folder('cleaned', filename)
+    data.to_csv(file, index=index)
+
+    if feather is None:
+        return
+
+    df = data.to_frame() if data.ndim == 1 else data
+    if index:
+        if df.index.nlevels == 1 and df.index.name is None:
+            df = df.rename_axis('Unnamed: 0')
+        df = df.reset_index()
+    else:
+        df = df.reset_index(drop=True)
+
+    df.columns = df.columns.map(str)
+    for column in df.columns[(df.dtypes == 'category').values]:
+        df[column] = df[column].astype(object)
+    if float32:
+        for column in df.columns[(df.dtypes == 'float64').values]:
+            df[column] = df[column].astype('float32')
+    if dates_as_strings:
+        for column in df.select_dtypes('datetime').columns:
+            df[column] = df[column].dt.strftime('%Y-%m-%d')
+
+    feather.write_feather(df, os.path.splitext(file)[0] + '.feather')
+
+LOCATION_IDS_FILE = join_to_data_folder('cleaned', 'location_ids.csv')
+
+_location_ids_lock = threading.Lock()
+
+
+def location_full_name(*parts):
+    """
+    Join the non-missing values of `parts` (Series with the same index) with ', ', row by row.
+
+    Vectorized equivalent of `', '.join(filter(pd.notna, parts))` per row, e.g.
+    `location_full_name(df.region, df.country)` gives 'Hubei, China' or 'France'.
+    """
+    full_name = pd.Series('', index=parts[0].index, dtype=object)
+    started = np.zeros(len(full_name), dtype=bool)
+    for part in parts:
+        present = part.notna().values
+        separator = np.where(started & present, ', ', '')
+        full_name = full_name + separator + part.where(present, '').astype(str)
+        started |= present
+    return full_name
+
+
+def location_ids(full_names, ids_file=LOCATION_IDS_FILE):
+    """
+    Stable integer IDs for location full names, shared by all cleaned tables.
+
+    IDs are kept in `ids_file`; names seen for the first time get the next free IDs in order of
+    appearance, so an ID never changes once assigned. Returns an int64 array aligned with `full_names`.
+    """
+    full_names = pd.Series(full_names, dtype=object)
+
+    with _location_ids_lock:
+        if os.path.exists(ids_file):
+            registry = pd.read_csv(ids_file, index_col='full_name', keep_default_na=False)['location_id']
+        else:
+            registry = pd.Series([], name='location_id', index=pd.Index([], name='full_name'), dtype='int64')
+
+        new_names = full_names[~full_names.isin(registry.index)].drop_duplicates()
+        if len(new_names):
+            next_id = registry.max() + 1 if len(registry) else 0
+            new_ids = pd.Series(
+                np.arange(next_id, next_id + len(new_names)),
+                index=pd.Index(new_names.values, name='full_name'), name='location_id'
+            )
+            registry = pd.concat([registry, new_ids])
+            registry.to_csv(ids_file + '.tmp', header=True)
+            os.replace(ids_file + '.tmp', ids_file)
+
+    return registry.reindex(full_names.values).values.astype('int64')
+
+
+def roll_up(df, by, sum_columns, mean_columns=(), weights=None, complete=None):
+    """
+    Aggregate the rows of `df` into one row per value of column `by`, in a single groupby-sum pass.
+
+    Parameters
+    ----------
+    sum_columns : Iterable[str]
+        Columns that are summed, e.g. the date columns of case counts.
+
+    mean_columns : Iterable[str]
+        Columns that are averaged over the rows where they are known, weighted by column `weights`
+        if given, e.g. latitude and longitude for the centroid.
+
+    complete : str
+        Only aggregate groups in which every row has a value in this column, e.g. 'region' to roll up
+        only countries that are fully split into regions and have no row of their own.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per group with `by`, `sum_columns` and `mean_columns`.
+    """
+    sum_columns, mean_columns = list(sum_columns), list(mean_columns)
+
+    if complete is not None:
+        df = df.loc[~df[by].isin(df.loc[df[complete].isna(), by])]
+
+    weight = np.ones(len(df)) if weights is None else df[weights].values.astype(float)
+    known = df[mean_columns].notna().multiply(weight, axis=0)
+    weighted = df[mean_columns].multiply(weight, axis=0)
+
+    totals = pd.concat(
+        [df[sum_columns], weighted.add_prefix('weighted '), known.add_prefix('weight ')], axis=1
+    ).groupby(df[by].values, sort=False).sum()
+
+    rolled_up = totals[sum_columns].copy()
+    for column in mean_columns:
+        rolled_up[column] = totals['weighted ' + column] / totals['weight ' + column]
+
+    return rolled_up.rename_axis(by).reset_index()
+
+
+# radius of the sphere EPSG:3857 projects onto, in metres
+EARTH_RADIUS = 6378137.0
+
+PROJECTION_CACHE_FILE = join_to_data_folder('projection_cache.csv')
+
+_projection_cache = {}
+_projection_cache_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_transformer(from_crs="epsg:4326", to_crs="epsg:3857"):
+    return Transformer.from_crs(from_crs, to_crs)
+
+
+def spherical_web_mercator(latitude, longitude):
+    "EPSG:4326 to EPSG:3857 with the closed form spherical mercator formulas."
+    latitude, longitude = np.radians(latitude), np.radians(longitude)
+    return EARTH_RADIUS * longitude, EARTH_RADIUS * np.log(np.tan(np.pi / 4 + latitude / 2))
+
+
+def longitude_latitude_to_web_mercator(latitude, longitude, method='numpy', cache_file=PROJECTION_CACHE_FILE):
+    """
+    Project latitudes and longitudes (scalars or arrays) to web mercator x and y.
+
+    Parameters
+    ----------
+    method : str
+        'numpy' evaluates the spherical mercator formulas directly. 'pyproj' goes through a cached
+        `pyproj.Transformer` and a persistent (latitude, longitude) lookup stored in `cache_file`,
+        so only coordinates not seen in a previous run are projected.
+    """
+    if method == 'numpy':
+        return spherical_web_mercator(np.asarray(latitude, dtype=float), np.asarray(longitude, dtype=float))
+    if method != 'pyproj':
+        raise ValueError(f'Unknown projection method {method!r}')
+
+    is_scalar = np.ndim(latitude) == 0
+    keys = list(zip(np.atleast_1d(latitude).astype(float).tolist(), np.atleast_1d(longitude).astype(float).tolist()))
+
+    with _projection_cache_lock:
+        cache = _projection_cache.get(cache_file)
+        if cache is None:
+            cache = _projection_cache[cache_file] = load_projection_cache(cache_file)
+
+        missing = sorted({key for key in keys if key not in cache and not np.isnan(key).any()})
+        if missing:
+            x, y = get_transformer().transform(*np.array(missing).T)
+            cache.update(zip(missing, zip(x.tolist(), y.tolist())))
+            save_projection_cache(cache, cache_file)
+
+        web_merc_x, web_merc_y = np.array([cache.get(key, (np.nan, np.nan)) for key in keys]).T
+
+    if is_scalar:
+        return web_merc_x[0], web_merc_y[0]
     return web_merc_x, web_merc_y
 
 
+def load_projection_cache(cache_file):
+    "Read a projection cache written by `save_projection_cache` into a {(latitude, longitude): (x, y)} dict."
+    if not os.path.exists(cache_file):
+        return {}
+
+    df = pd.read_csv(cache_file)
+    return dict(zip(
+        zip(df.latitude.tolist(), df.longitude.tolist()),
+        zip(df.web_mercator_x.tolist(), df.web_mercator_y.tolist())
+    ))
+
+
+def save_projection_cache(cache, cache_file):
+    (latitude, longitude), (x, y) = zip(*cache.keys()), zip(*cache.values())
+    df = pd.DataFrame({'latitude': latitude, 'longitude': longitude, 'web_mercator_x': x, 'web_mercator_y': y})
+    df.to_csv(cache_file + '.tmp', index=False, float_format='%.17g')
+    os.replace(cache_file + '.tmp', cache_file)
+
+
+
+def write_shared_matrix(df, filename, layout, dtype='float32'):
+    """
+    Write the (dates × labels) case matrix of a cleaned table to `data/cleaned/arrays/` as a
+    fixed-layout .npy file plus a .json sidecar, for the app's worker processes to memory-map.
+
+    `layout` is 'table' for tables indexed by date with one column per region (labels are the
+    columns, e.g. *_cases_vs_time.csv) and 'locations' for tables with one row per location and
+    YYYY-MM-DD columns (labels are the `full_name`s of the rows, e.g. time_series_covid_19_confirmed*.csv).
+    Files are swapped in atomically so running workers keep their current mapping.
+    """
+    if layout == 'table':
+        values, dates, labels = df.values, df.index, df.columns
+    else:
+        date_columns = [column for column in df.columns if DATE_COLUMN_PATTERN.fullmatch(column)]
+        values, dates, labels = df[date_columns].values.T, date_columns, df['full_name']
+
+    stem = _shared_matrix_stem(filename)
+
+    with open(stem + '.npy.tmp', 'wb') as fh:
+        np.save(fh, np.ascontiguousarray(values, dtype=dtype))
+    os.replace(stem + '.npy.tmp', stem + '.npy')
+
+    _write_shared_matrix_metadata(stem, filename, layout, values.shape, dtype, dates, labels)
+
+
+def _shared_matrix_stem(filename):
+    folder = join_to_data_folder('cleaned', 'arrays')
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, os.path.splitext(filename)[0])
+
+
+def _write_shared_matrix_metadata(stem, filename, layout, shape, dtype, dates, labels):
+    metadata = {
+        'source': filename,
+        'layout': layout,
+        'shape': list(shape),
+        'dtype': dtype,
+        'dates': [date.strftime('%Y-%m-%d') for date in pd.to_datetime(dates)],
+        'labels': [str(label) for label in labels],
+    }
+    with open(stem + '.json.tmp', 'w') as fh:
+        json.dump(metadata, fh)
+    os.replace(stem + '.json.tmp', stem + '.json')
+
+
+class ChunkedCleanedDataWriter:
+    """
+    Streaming counterpart of `write_cleaned_data` (with `index=False`) and, for tables in the
+    'locations' layout, `write_shared_matrix`: chunks of rows are appended to the CSV, to the Feather
+    file as Arrow record batches and to a scratch file of case values, so only one chunk is held in
+    memory at a time. All chunks must have the same columns. Use as a context manager; the files are
+    put in place on a clean exit.
+    """
+    def __init__(self, filename, shared_matrix=False, dtype='float32', block_size=1024):
+        self.filename = filename
+        self.file = join_to_data_folder('cleaned', filename)
+        self.feather_file = os.path.splitext(self.file)[0] + '.feather'
+        self.shared_matrix = shared_matrix
+        self.dtype = dtype
+        self.block_size = block_size
+
+        self.columns = None
+        self.date_columns = None
+        self.labels = []
+        self.n_rows = 0
+        self._schema = None
+        self._feather_writer = None
+
+    def __enter__(self):
+        self._csv = open(self.file + '.tmp', 'w', newline='')
+        if self.shared_matrix:
+            self._stem = _shared_matrix_stem(self.filename)
+            self._values = open(self._stem + '.values.tmp', 'wb')
+        return self
+
+    def write(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            self.date_columns = [column for column in self.columns if DATE_COLUMN_PATTERN.fullmatch(column)]
+        elif list(chunk.columns) != self.columns:
+            raise ValueError(f'Chunk columns differ from those of the first chunk of {self.filename}')
+
+        chunk.to_csv(self._csv, index=False, header=self.n_rows == 0)
+
+        if feather is not None:
+            if self._feather_writer is None:
+                schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                # text columns that are empty throughout the first chunk would be typed as null
+                for i, field in enumerate(schema):
+                    if pa.types.is_null(field.type):
+                        schema = schema.set(i, pa.field(field.name, pa.string()))
+                self._schema = schema
+                self._feather_writer = pa.ipc.new_file(self.feather_file + '.tmp', schema)
+            self._feather_writer.write_table(
+                pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False)
+            )
+
+        if self.shared_matrix:
+            np.ascontiguousarray(chunk[self.date_columns].values, dtype=self.dtype).tofile(self._values)
+            self.labels.extend(chunk['full_name'])
+
+        self.n_rows += len(chunk)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._csv.close()
+        if self._feather_writer is not None:
+            self._feather_writer.close()
+        if self.shared_matrix:
+            self._values.close()
+
+        if exc_type is None:
+            os.replace(self.file + '.tmp', self.file)
+            if self._feather_writer is not None:
+                os.replace(self.feather_file + '.tmp', self.feather_file)
+            if self.shared_matrix:
+                self._write_shared_matrix()
+
+        for leftover in (self.file + '.tmp', self.feather_file + '.tmp'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        if self.shared_matrix and os.path.exists(self._stem + '.values.tmp'):
+            os.remove(self._stem + '.values.tmp')
+
+    def _write_shared_matrix(self):
+        "Transpose the (locations × dates) scratch file into the (dates × locations) matrix, a block of locations at a time."
+        shape = (len(self.date_columns), self.n_rows)
+        values = np.memmap(self._stem + '.values.tmp', dtype=self.dtype, mode='r', shape=shape[::-1])
+        matrix = np.lib.format.open_memmap(self._stem + '.npy.tmp', mode='w+', dtype=self.dtype, shape=shape)
+        for start in range(0, self.n_rows, self.block_size):
+            matrix[:, start:start + self.block_size] = values[start:start + self.block_size].T
+        matrix.flush()
+        del matrix, values
+        os.replace(self._stem + '.npy.tmp', self._stem + '.npy')
+
+        _write_shared_matrix_metadata(
+            self._stem, self.filename, 'locations', shape, self.dtype, self.date_columns, self.labels
+        )
+
+
 # SIR Modeling
 class Model:
     """
@@ -1,52 +1,356 @@
-from functools import partial, wraps
+import json
+import os
+import re
+from functools import partial
 
+import numpy as np
 import pandas as pd
 from bokeh.models import ColumnDataSource
 
+from spatial import MapLevel
 from utils import START_DATE, START_DATE_STRING, join_to_data_folder, scale
 
+DATE_COLUMN_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+MILLISECONDS_PER_DAY = 24 * 60 * 60 * 1000
 
-def get_df_and_CDS(filename):
-    "Base factory for fetching pandas DataFrame and bokeh ColumnDataSource from a file."
-    file = join_to_data_folder('cleaned', filename)
-    df = pd.read_csv(file)
-    CDS = ColumnDataSource(df)
+try:
+    import pyarrow.feather as feather
+except ImportError:  # the Feather copies of the cleaned files are optional
+    feather = None
+
+# Process-wide cache shared by every session: (filename, key) -> (file, mtime, value).
+# The cached objects are treated as read-only; sessions only ever get shallow views of them.
+_dataset_cache = {}
+
+
+def cleaned_file(filename):
+    "Path to read a cleaned file from: its Feather copy if pyarrow is installed and the copy is up to date, else the CSV."
+    csv_file = join_to_data_folder('cleaned', filename)
+    feather_file = os.path.splitext(csv_file)[0] + '.feather'
+
+    if (
+        feather is not None
+        and os.path.exists(feather_file)
+        and os.path.getmtime(feather_file) >= os.path.getmtime(csv_file)
+    ):
+        return feather_file
+    return csv_file
+
+
+def read_cleaned_file(file, columns=None):
+    "Read (the given `columns` of) a path returned by `cleaned_file`, memory-mapping Feather files."
+    if file.endswith('.feather'):
+        return feather.read_table(file, columns=columns, memory_map=True).to_pandas()
+    return pd.read_csv(file, usecols=columns)
+
+
+def load_shared_matrix(filename):
+    """
+    Memory-map the case matrix the cleaning scripts saved for a cleaned file in `data/cleaned/arrays/`.
+
+    Returns (values, metadata) where `values` is a read-only (dates × labels) array shared by every
+    process mapping it and `metadata` is the .json sidecar (layout, dates, labels), or None when the
+    matrix is missing or older than the CSV.
+    """
+    stem = join_to_data_folder('cleaned', 'arrays', os.path.splitext(filename)[0])
+    csv_file = join_to_data_folder('cleaned', filename)
+
+    if not os.path.exists(stem + '.json') or os.path.getmtime(stem + '.json') < os.path.getmtime(csv_file):
+        return None
+
+    with open(stem + '.json', 'r') as fh:
+        metadata = json.load(fh)
+    values = np.load(stem + '.npy', mmap_mode='r')
+
+    return values, metadata
+
+
+def cached_on_file(filename, key, build):
+    "Return `build(file)` for a cleaned file, cached process-wide until the file read or its mtime changes."
+    file = cleaned_file(filename)
+    mtime = os.path.getmtime(file)
+    cache_key = (filename, key)
+
+    cached = _dataset_cache.get(cache_key)
+    if cached is None or cached[:2] != (file, mtime):
+        cached = _dataset_cache[cache_key] = (file, mtime, build(file))
+
+    return cached[2]
+
+
+def load_cleaned_dataset(filename, *processors):
+    """
+    Parse a cleaned file once per process and return the shared (DataFrame, column data) pair.
+
+    `processors` are applied in order as `df, data = processor(df, data)` on the freshly parsed file;
+    their results are cached alongside it. The file is parsed again whenever its mtime changes.
+    """
+    def build(file):
+        shared = load_shared_matrix(filename)
+        if shared is not None and shared[1]['layout'] == 'table':
+            df, data = shared_table(*shared)
+        else:
+            df = read_cleaned_file(file)
+            data = ColumnDataSource._data_from_df(df)
+        for processor in processors:
+            df, data = processor(df, data)
+        return df, data
+
+    return cached_on_file(filename, processors, build)
+
+
+def shared_table(values, metadata):
+    """
+    (DataFrame, column data) pair of a date indexed table viewing a shared matrix without copying it.
+
+    The DataFrame is already indexed by `date`; the column data has the `index` and `date` columns
+    `ColumnDataSource` would add plus one column per label.
+    """
+    dates = pd.DatetimeIndex(metadata['dates'], name='date')
+    df = pd.DataFrame(values, index=dates, columns=metadata['labels'], copy=False)
+
+    data = {'index': np.arange(len(dates)), 'date': dates.values}
+    data.update((label, values[:, i]) for i, label in enumerate(metadata['labels']))
+
+    return df, data
+
+
+def get_df_and_CDS(filename, *processors):
+    """
+    Base factory for fetching pandas DataFrame and bokeh ColumnDataSource from a file.
+
+    The DataFrame is shared between sessions and must not be modified. The ColumnDataSource
+    is per session: replacing its columns is safe, mutating the shared arrays in place is not.
+    """
+    df, data = load_cleaned_dataset(filename, *processors)
+    CDS = ColumnDataSource(data=dict(data))
 
     return df, CDS
 
 
-def include_number_and_sizes(func):
+def include_number_and_sizes(df, data):
     "Add number and sizes columns to ColumnDataSource that help with plotting data for a particular date."
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        df, CDS = func(*args, **kwargs)
-        CDS.data['number'] = df[START_DATE_STRING]
-        CDS.data['sizes'] = df[START_DATE_STRING].apply(scale)
-        return df, CDS
-    return wrapper
-
-
-def convert_date_column(func):
-    "Converts date column of CDS to datetime."
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        df, CDS = func(*args, **kwargs)
-        df.set_index('date', inplace=True)
+    data = dict(data)
+    data['number'] = df[START_DATE_STRING].values
+    data['sizes'] = scale(df[START_DATE_STRING].values)
+    for values in (data['number'], data['sizes']):
+        values.setflags(write=False)
+    return df, data
+
+
+def convert_date_column(df, data):
+    "Converts date column of CDS to datetime and indexes the DataFrame by it (a no-op for typed or shared files)."
+    if 'date' in df.columns:
+        df = df.set_index('date')
         df.index = pd.to_datetime(df.index, yearfirst=True)
-        CDS.data['date'] = pd.to_datetime(CDS.data['date'], yearfirst=True)
-        return df, CDS
-    return wrapper
+    data = dict(data)
+    data['date'] = pd.to_datetime(data['date'], yearfirst=True)
+    return df, data
+
+
+class DateMatrices:
+    """
+    Dense (dates × locations) matrices built from the date columns of a wide location table.
+
+    Row `i` holds the value of every location `i` days after `start_date`, so moving a date slider
+    is a single row slice. Days without a column in the table have no row (see `row`). Only `number`
+    is stored as a matrix (possibly memory-mapped and shared between processes); the columns derived
+    from it are computed for one row at a time by `date_columns`.
+    """
+    def __init__(self, start_date, number, has_row, population=None):
+        self.start_date = start_date
+        self.number = number
+        self.has_row = has_row
+        self.population = population
+
+        self.number.setflags(write=False)
+
+    def date_columns(self, row, indices=None):
+        """
+        number, sizes and, with population, number_per_capita at date row `row`, restricted to the
+        locations at `indices` if given.
+        """
+        number = self.number[row] if indices is None else self.number[row, indices]
+        columns = {'number': number, 'sizes': scale(number)}
+        if self.population is not None:
+            population = self.population if indices is None else self.population[indices]
+            columns['number_per_capita'] = number / population
+        return columns
+
+    @classmethod
+    def from_df(cls, df, population_column=None):
+        "Build from a wide location table whose date columns are labelled YYYY-MM-DD."
+        date_columns = [column for column in df.columns if DATE_COLUMN_PATTERN.fullmatch(column)]
+        days = pd.to_datetime(date_columns, yearfirst=True).values.astype('datetime64[D]')
+
+        start_date = days.min()
+        offsets = (days - start_date).astype(int)
+
+        number = np.full((offsets.max() + 1, len(df)), np.nan)
+        number[offsets] = df[date_columns].values.T
+        has_row = np.zeros(number.shape[0], dtype=bool)
+        has_row[offsets] = True
+
+        population = None if population_column is None else df[population_column].values.astype(float)
+
+        return cls(start_date, number, has_row, population)
+
+    @classmethod
+    def from_shared(cls, values, dates, population=None):
+        "Build on a shared (dates × locations) matrix; consecutive dates are used without copying."
+        days = np.array(dates, dtype='datetime64[D]')
+
+        start_date = days.min()
+        offsets = (days - start_date).astype(int)
+
+        if np.array_equal(offsets, np.arange(offsets.size)):
+            number = values
+        else:
+            number = np.full((offsets.max() + 1, values.shape[1]), np.nan)
+            number[offsets] = values
+        has_row = np.zeros(number.shape[0], dtype=bool)
+        has_row[offsets] = True
+
+        return cls(start_date, number, has_row, population)
+
+    def aggregate(self, groups):
+        "DateMatrices over groups of locations, summing the locations that share a group index 0..n-1."
+        order = np.argsort(groups, kind='stable')
+        starts = np.flatnonzero(np.diff(groups[order], prepend=-1))
+
+        number = np.add.reduceat(self.number[:, order], starts, axis=1)
+        population = None if self.population is None else np.add.reduceat(self.population[order], starts)
+
+        return DateMatrices(self.start_date, number, self.has_row, population)
+
+    def row(self, milliseconds):
+        "Row index for a bokeh date value (milliseconds since epoch), or None if there is no data for that day."
+        offset = int(milliseconds // MILLISECONDS_PER_DAY) - self.start_date.astype(int)
+        if 0 <= offset < self.has_row.size and self.has_row[offset]:
+            return offset
+        return None
+
+    def row_for_date(self, date):
+        "Row index for a `datetime.date`, or None if there is no data for that day."
+        return self.row(np.datetime64(date, 'ms').astype(int))
+
+
+def get_date_matrices(filename, population_column=None):
+    "Shared `DateMatrices` for a cleaned wide location table, on its memory-mapped matrix when there is one."
+    def build(file):
+        shared = load_shared_matrix(filename)
+        if shared is None:
+            return DateMatrices.from_df(load_cleaned_dataset(filename)[0], population_column)
+
+        values, metadata = shared
+        population = None
+        if population_column is not None:
+            population = read_cleaned_file(file, [population_column])[population_column].values.astype(float)
+        return DateMatrices.from_shared(values, metadata['dates'], population)
+
+    return cached_on_file(filename, ('date_matrices', population_column), build)
+
+
+def get_map_levels(filename, location_columns, population_column=None, aggregations=()):
+    """
+    Shared levels of detail of a wide location table, most detailed first.
+
+    The first `MapLevel` holds every location with its `location_columns`; each (key_column, label)
+    pair in `aggregations` adds a coarser level built by `MapLevel.aggregate`.
+    """
+    def build(file):
+        df = read_cleaned_file(file, list(location_columns))
+        levels = [MapLevel(
+            {column: df[column].values for column in location_columns},
+            get_date_matrices(filename, population_column)
+        )]
+        for key_column, label in aggregations:
+            levels.append(levels[0].aggregate(key_column, label))
+        return levels
+
+    return cached_on_file(filename, ('map_levels', location_columns, population_column, aggregations), build)
+
+
+def get_first_case_offsets(filename):
+    """
+    Days from `START_DATE` to the first positive value of every column of a cleaned cases vs time table,
+    as a Series by column; columns without cases are left out. Computed at once for every column and shared.
+    """
+    def build(file):
+        df, _ = load_cleaned_dataset(filename, convert_date_column)
+        positive = np.asarray(df.values) > 0
+        first = positive.argmax(axis=0)
+        offsets = pd.Series((df.index[first] - pd.to_datetime(START_DATE)).days, index=df.columns)
+        return offsets[positive.any(axis=0)]
+
+    return cached_on_file(filename, 'first_case_offsets', build)
+
+
+def patch_changed_rows(CDS, columns, max_changed_fraction=0.5):
+    """
+    Update `columns` (name -> new values) of a ColumnDataSource, sending only the rows that changed.
+
+    Rows are compared with the values currently in the CDS (NaN equals NaN). When more than
+    `max_changed_fraction` of the rows changed, the columns are replaced outright instead.
+    `CDS.patch` writes into the existing arrays, so the patched columns must be per-session copies.
+    """
+    new_columns = {name: np.asarray(values) for name, values in columns.items()}
+
+    changed = np.zeros(len(next(iter(new_columns.values()))), dtype=bool)
+    for name, new_values in new_columns.items():
+        old_values = np.asarray(CDS.data[name])
+        changed |= ~((old_values == new_values) | (np.isnan(old_values) & np.isnan(new_values)))
+
+    rows = np.flatnonzero(changed)
+    if rows.size == 0:
+        return
+
+    if rows.size > max_changed_fraction * changed.size:
+        CDS.data.update({name: np.array(values) for name, values in new_columns.items()})
+    else:
+        rows_list = rows.tolist()
+        CDS.patch({
+            name: list(zip(rows_list, values[rows].tolist()))
+            for name, values in new_columns.items()
+        })
 
 
 get_line_list_data = partial(get_df_and_CDS, 'COVID19_line_list_data.csv')
 
-get_country_cases_vs_time = convert_date_column(partial(get_df_and_CDS, 'country_cases_vs_time.csv'))
+get_country_cases_vs_time = partial(get_df_and_CDS, 'country_cases_vs_time.csv', convert_date_column)
+
+get_US_cases_vs_time = partial(get_df_and_CDS, 'US_cases_vs_time.csv', convert_date_column)
+
+# shared (DataFrame, column data) pairs without a ColumnDataSource, for a `column_store.ColumnStore`
+get_country_cases_vs_time_columns = partial(load_cleaned_dataset, 'country_cases_vs_time.csv', convert_date_column)
+
+get_US_cases_vs_time_columns = partial(load_cleaned_dataset, 'US_cases_vs_time.csv', convert_date_column)
+
+get_country_first_case_offsets = partial(get_first_case_offsets, 'country_cases_vs_time.csv')
+
+get_US_first_case_offsets = partial(get_first_case_offsets, 'US_cases_vs_time.csv')
+
+get_time_series_confirmed_US_data = partial(get_df_and_CDS, 'time_series_covid_19_confirmed_US.csv', include_number_and_sizes)
+
+get_time_series_confirmed_data = partial(get_df_and_CDS, 'time_series_covid_19_confirmed.csv', include_number_and_sizes)
+
+get_time_series_confirmed_US_date_matrices = partial(get_date_matrices, 'time_series_covid_19_confirmed_US.csv', 'population')
 
-get_US_cases_vs_time = convert_date_column(partial(get_df_and_CDS, 'US_cases_vs_time.csv'))
+get_time_series_confirmed_date_matrices = partial(get_date_matrices, 'time_series_covid_19_confirmed.csv')
 
-get_time_series_confirmed_US_data = include_number_and_sizes(partial(get_df_and_CDS, 'time_series_covid_19_confirmed_US.csv'))
+get_time_series_confirmed_US_map_levels = partial(
+    get_map_levels,
+    'time_series_covid_19_confirmed_US.csv',
+    ('county', 'region', 'full_name', 'population', 'web_mercator_x', 'web_mercator_y'),
+    'population',
+    (('region', '{}, US'.format),)
+)
 
-get_time_series_confirmed_data = include_number_and_sizes(partial(get_df_and_CDS, 'time_series_covid_19_confirmed.csv'))
+get_time_series_confirmed_map_levels = partial(
+    get_map_levels,
+    'time_series_covid_19_confirmed.csv',
+    ('full_name', 'web_mercator_x', 'web_mercator_y')
+)
 
 get_countries_logistic_fitting_params = partial(get_df_and_CDS, 'countries_logistic_fitting_params.csv')
 
@@ -54,4 +358,4 @@ get_US_logistic_fitting_params = partial(get_df_and_CDS, 'US_logistic_fitting_pa
 
 get_symptom_rates = partial(get_df_and_CDS, 'symptom_rates.csv')
 
-get_line_list_analysis = partial(get_df_and_CDS, 'line_list_analysis.csv')
\ No newline at end of file
+get_line_list_analysis = partial(get_df_and_CDS, 'line_list_analysis.csv')
@@ -0,0 +1,122 @@
+import numpy as np
+
+
+class MapLevel:
+    """
+    One level of detail of a map: static per-location columns and the matching `DateMatrices`.
+
+    `columns` maps ColumnDataSource column names to arrays with one entry per location and must
+    include `web_mercator_x` and `web_mercator_y`.
+    """
+    def __init__(self, columns, matrices):
+        self.columns = columns
+        self.matrices = matrices
+        self._index = None
+
+    @property
+    def index(self):
+        "`GridIndex` over the locations' web mercator coordinates, built on first use."
+        if self._index is None:
+            self._index = GridIndex(self.columns['web_mercator_x'], self.columns['web_mercator_y'])
+        return self._index
+
+    def date_columns(self, row, indices=None):
+        """
+        Date dependent columns (number, sizes and, with population, number_per_capita) at date row `row`,
+        restricted to the locations at `indices` if given.
+        """
+        return self.matrices.date_columns(row, indices)
+
+    def data(self, row, indices=None):
+        """
+        Full ColumnDataSource data at date row `row`, restricted to the locations at `indices` if given.
+        Date dependent columns are copies, so they can be patched.
+        """
+        columns = self.columns if indices is None else {
+            name: values[indices] for name, values in self.columns.items()
+        }
+        return {
+            **columns,
+            **{name: np.array(values) for name, values in self.date_columns(row, indices).items()}
+        }
+
+    def aggregate(self, key_column, label):
+        """
+        Coarser level with one location per distinct value of `key_column`.
+
+        Counts and populations are summed; coordinates become the (population weighted) centroid.
+        `full_name` is `label(key)` and any other static column is left blank.
+        """
+        keys, groups = np.unique(self.columns[key_column].astype(str), return_inverse=True)
+        matrices = self.matrices.aggregate(groups)
+
+        weights = self.matrices.population if self.matrices.population is not None else np.ones(groups.size)
+        total_weights = np.bincount(groups, weights)
+
+        columns = {name: np.full(keys.size, '', dtype=object) for name in self.columns}
+        columns.update({
+            key_column: keys,
+            'full_name': np.array([label(key) for key in keys], dtype=object),
+            'web_mercator_x': np.bincount(groups, weights * self.columns['web_mercator_x']) / total_weights,
+            'web_mercator_y': np.bincount(groups, weights * self.columns['web_mercator_y']) / total_weights,
+        })
+        if matrices.population is not None and 'population' in self.columns:
+            columns['population'] = matrices.population
+
+        return MapLevel(columns, matrices)
+
+
+def select_level(levels, extent):
+    """
+    Pick the first (max_points, level) pair with at most `max_points` locations inside `extent`.
+
+    `extent` is (x_start, x_end, y_start, y_end). Returns the level and the indices of those locations;
+    the last level is used whatever its count, so its `max_points` may be None.
+    """
+    for max_points, level in levels:
+        indices = level.index.query(*extent)
+        if max_points is None or indices.size <= max_points:
+            break
+    return level, indices
+
+
+class GridIndex:
+    """
+    Uniform grid over point coordinates for rectangular extent queries.
+
+    Points are bucketed into `cells_per_side` × `cells_per_side` cells and kept sorted by cell,
+    so a query only looks at the points of the cells overlapping the extent.
+    """
+    def __init__(self, x, y, cells_per_side=64):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.cells_per_side = cells_per_side
+
+        self.x_min, self.y_min = np.nanmin(self.x), np.nanmin(self.y)
+        self.cell_width = (np.nanmax(self.x) - self.x_min) / cells_per_side or 1.0
+        self.cell_height = (np.nanmax(self.y) - self.y_min) / cells_per_side or 1.0
+
+        keys = self._cell(self.x, self.x_min, self.cell_width) * cells_per_side + self._cell(self.y, self.y_min, self.cell_height)
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+
+    def _cell(self, values, origin, size):
+        cells = np.nan_to_num((np.asarray(values, dtype=float) - origin) // size)
+        return np.clip(cells, 0, self.cells_per_side - 1).astype(int)
+
+    def query(self, x_start, x_end, y_start, y_end):
+        "Sorted indices of the points with x_start <= x <= x_end and y_start <= y <= y_end."
+        cell_x_start, cell_x_end = self._cell([x_start, x_end], self.x_min, self.cell_width)
+        cell_y_start, cell_y_end = self._cell([y_start, y_end], self.y_min, self.cell_height)
+
+        candidates = np.concatenate([
+            self.order[
+                np.searchsorted(self.sorted_keys, cell_x * self.cells_per_side + cell_y_start, 'left'):
+                np.searchsorted(self.sorted_keys, cell_x * self.cells_per_side + cell_y_end, 'right')
+            ]
+            for cell_x in range(cell_x_start, cell_x_end + 1)
+        ])
+        x, y = self.x[candidates], self.y[candidates]
+        inside = (x >= x_start) & (x <= x_end) & (y >= y_start) & (y <= y_end)
+
+        return np.sort(candidates[inside])
@@ -0,0 +1,141 @@
+import numpy as np
+from bokeh.layouts import column, row
+from bokeh.models import HoverTool, MultiSelect, Panel
+from bokeh.palettes import viridis, Viridis256
+from bokeh.plotting import figure
+
+from column_store import ColumnStore
+from downsampling import Downsampler
+from reference_lines import DOUBLING_PERIODS, add_doubling_lines
+
+# all-NaN column the idle line renderers are bound to
+IDLE_COLUMN = '_idle'
+
+DEFAULT_POOL_SIZE = 8
+
+
+def create_cases_time_series_tab(get_columns, starting_regions, title, figure_title, pool_size=DEFAULT_POOL_SIZE,
+                                 doubling_periods=DOUBLING_PERIODS):
+    """
+    Panel plotting the cases of the regions picked in a `MultiSelect` over time.
+
+    `get_columns()` returns the shared (DataFrame, column data) pair of a cases vs time table, see
+    `sources.load_cleaned_dataset`. Lines come from a pool of `pool_size` renderers whose `y` field
+    is rebound to the selected regions; the pool only grows when more regions are shown at once.
+    The lines are downsampled to the figure's width, see `downsampling.Downsampler`. Guides of cases
+    doubling every one of `doubling_periods` days are drawn behind them and left out of the hover tool.
+    """
+    ## Data Sources
+    source_df, source_data = get_columns()
+    column_store = ColumnStore(
+        {**source_data, IDLE_COLUMN: np.full(len(source_data['date']), np.nan)},
+        starting_regions,
+        always=('index', 'date', IDLE_COLUMN)
+    )
+    source_CDS = column_store.source
+    excluded_columns_set = {'index', 'date'}
+
+    ## Line Plots
+    line_figure = figure(
+        x_axis_type='datetime',
+        y_axis_type='log',
+        title=figure_title,
+        x_axis_label='Date',
+        y_axis_label='Number of Confirmed Cases (Logarithmic Scale)',
+        active_scroll='wheel_zoom'
+    )
+
+    add_doubling_lines(line_figure, source_data['date'], doubling_periods)
+
+    downsampler = Downsampler(column_store, line_figure.x_range, line_figure.plot_width, starting_regions, log_y=True)
+
+    line_params = {
+        'x': 'date',
+        'source': source_CDS,
+        'line_width': 4,
+        'alpha': 0.6
+    }
+
+    def add_line(color):
+        return line_figure.line(y=IDLE_COLUMN, name='', line_color=color, visible=False, **line_params)
+
+    free_lines = [add_line(color) for color in viridis(pool_size)]
+    lines = {}
+
+    line_figure.legend.location = 'top_left'
+    line_figure.legend.click_policy = 'hide'
+
+    hover_tool = HoverTool(
+        tooltips=[
+            ('Date', '@date{%F}'),
+            ('Region', '$name'),
+            ('Number of Cases', '@$name{0,0}')
+        ],
+        formatters={
+            '@date': 'datetime',
+        },
+        renderers=[
+            *free_lines
+        ],
+        # mode='vline'
+    )
+
+    line_figure.add_tools(hover_tool)
+
+    def show_line(key):
+        if free_lines:
+            line = free_lines.pop(0)
+        else:
+            line = add_line(np.random.choice(Viridis256))
+            hover_tool.renderers = [*hover_tool.renderers, line]
+
+        line.glyph.y = key
+        line.name = key
+        line.visible = True
+        lines[key] = line
+
+    def hide_line(key):
+        line = lines.pop(key)
+        line.visible = False
+        line.glyph.y = IDLE_COLUMN
+        line.name = ''
+        free_lines.append(line)
+
+    for key in starting_regions:
+        show_line(key)
+
+    ## Region Selector
+    labels = [
+        key
+        for key in source_df.columns
+        if key not in excluded_columns_set
+    ]
+
+    def region_select_callback(attr, old, new):
+        new_lines = set(new) - set(old)
+        old_lines = set(old) - set(new)
+
+        for key in old_lines:
+            hide_line(key)
+        column_store.release(old_lines)
+
+        downsampler.set_columns(new)
+        column_store.require(new_lines)
+        for key in new_lines:
+            show_line(key)
+
+    region_select = MultiSelect(
+        title='Select Regions to Show',
+        value=starting_regions,
+        options=labels,
+        sizing_mode='stretch_height'
+    )
+    region_select.on_change('value', region_select_callback)
+
+    ## Create Layout
+    child = row([
+        column([line_figure]),
+        column([region_select]),
+    ])
+
+    return Panel(child=child, title=title)
@@ -8,16 +8,20 @@ from bokeh.plotting import figure
 from bokeh.tile_providers import CARTODBPOSITRON, get_provider
 from bokeh.transform import log_cmap
 
-from sources import get_time_series_confirmed_US_data
-from utils import START_DATE, START_DATE_STRING, scale
+from callbacks import on_change_throttled
+from map_view import MapView
+from sources import get_time_series_confirmed_US_map_levels
+from utils import START_DATE
+
+# Most counties sent at once; states are drawn while more than this many are in the fetched extent
+MAX_COUNTIES = 500
 
 
 def create_us_map_tab():
     "Factory for creating second tab of app: US Only Data"
 
     ## Data Sources
-    source_df_confirmed, source_CDS = get_time_series_confirmed_US_data()
-    source_CDS.data['number_per_capita'] = source_df_confirmed[START_DATE_STRING] / source_df_confirmed['population']
+    counties, states = get_time_series_confirmed_US_map_levels()
 
     ## Map
     color_mapper = log_cmap(field_name='number', palette=Spectral6, low=1, high=1e6)
@@ -40,6 +44,15 @@ def create_us_map_tab():
         active_scroll='wheel_zoom',
     )
 
+    ## Level of Detail & Viewport Culling
+    map_view = MapView(
+        [(MAX_COUNTIES, counties), (None, states)],
+        counties.matrices.row_for_date(START_DATE),
+        map_figure.x_range,
+        map_figure.y_range
+    )
+    source_CDS = map_view.source
+
     tile_provider = get_provider(CARTODBPOSITRON)
     map_figure.add_tile(tile_provider)
     map_figure.circle(
@@ -57,19 +70,12 @@ def create_us_map_tab():
 
     ## Slider
     def slider_callback(attr, old, new):
-        delta = datetime.timedelta(milliseconds=new)
-        date = datetime.date(1970, 1, 1) + delta
-        date_string = date.strftime('%Y-%m-%d')
-
-        try:
-            source_CDS.data['number'] = source_df_confirmed[date_string]
-            source_CDS.data['sizes'] = source_df_confirmed[date_string].apply(scale)
-            source_CDS.data['number_per_capita'] = source_df_confirmed[date_string] / source_df_confirmed['population']
-        except KeyError:
-            pass
+        row = counties.matrices.row(new)
+        if row is not None:
+            map_view.set_row(row)
 
     slider = DateSlider(title='Date', start=START_DATE, end=datetime.date.today(), step=1, value=START_DATE)
-    slider.on_change('value', slider_callback)
+    on_change_throttled(slider, 'value', slider_callback)
 
     ## Data Table
     columns = [
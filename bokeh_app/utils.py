@@ -3,12 +3,16 @@ import math
 import os
 from functools import partial
 
+import numpy as np
+
 
 def scale(value, min_size=4, log_base=math.e):
-    try:
-        return math.log(value, log_base) + min_size
-    except ValueError:
-        return 0
+    "Marker size log(value) + min_size, or 0 for non-positive values. Works element-wise on arrays and Series."
+    values = np.asarray(value, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sizes = np.where(values <= 0, 0.0, np.log(values) / math.log(log_base) + min_size)
+
+    return float(sizes) if sizes.ndim == 0 else sizes
 
 
 START_DATE = datetime.date(2020, 1, 22)
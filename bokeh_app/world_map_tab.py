@@ -8,16 +8,18 @@ from bokeh.tile_providers import CARTODBPOSITRON, get_provider
 from bokeh.transform import log_cmap
 from bokeh.layouts import column, row
 
-from utils import START_DATE, scale
+from utils import START_DATE
 
-from sources import get_time_series_confirmed_data
+from callbacks import on_change_throttled
+from map_view import MapView
+from sources import get_time_series_confirmed_map_levels
 
 
 def create_world_map_tab():
     "Factory for creating first tab of app."
 
     ## Data Sources
-    source_df, source_CDS = get_time_series_confirmed_data()
+    regions, = get_time_series_confirmed_map_levels()
 
     ## Map
     color_mapper = log_cmap(field_name='number', palette=Spectral6, low=1, high=1e6)
@@ -37,6 +39,15 @@ def create_world_map_tab():
         active_scroll='wheel_zoom'
     )
 
+    ## Viewport Culling
+    map_view = MapView(
+        [(None, regions)],
+        regions.matrices.row_for_date(START_DATE),
+        map_figure.x_range,
+        map_figure.y_range
+    )
+    source_CDS = map_view.source
+
     tile_provider = get_provider(CARTODBPOSITRON)
     map_figure.add_tile(tile_provider)
     map_figure.circle(
@@ -54,18 +65,12 @@ def create_world_map_tab():
 
     ## Slider
     def slider_callback(attr, old, new):
-        delta = datetime.timedelta(milliseconds=new)
-        date = datetime.date(1970, 1, 1) + delta
-        date_string = date.strftime('%Y-%m-%d')
-
-        try:
-            source_CDS.data['number'] = source_df[date_string]
-            source_CDS.data['sizes'] = source_df[date_string].apply(scale)
-        except KeyError:
-            pass
+        row = regions.matrices.row(new)
+        if row is not None:
+            map_view.set_row(row)
 
     slider = DateSlider(title='Date', start=START_DATE, end=datetime.date.today(), step=1, value=START_DATE)
-    slider.on_change('value', slider_callback)
+    on_change_throttled(slider, 'value', slider_callback)
 
     ## Data Table
     columns = [